@@ -1,29 +1,267 @@
-import os, io, json
+import time
+_T_START = time.perf_counter()
+import os, functools
 import numpy as np
-from PIL import Image
 from flask import Flask, request, jsonify, send_from_directory
-import tensorflow as tf
-from tensorflow import keras
 from scripts.rule_engine import interpret
+from scripts.batching import QueueFullError
+from scripts.inference import unpack_attributes
+from scripts.preprocessing import normalize, ImageTooLargeError
+from scripts.model_manager import ModelManager
+from scripts.prediction_cache import cache_key, make_prediction_cache
+from scripts.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, SamplingProfiler
 
-IMG_SIZE = 128
+# gom các request đồng thời thành 1 lần model.predict
+BATCH_MAX_SIZE   = int(os.environ.get("PALM_BATCH_MAX_SIZE", 32))
+BATCH_MAX_WAIT_MS = float(os.environ.get("PALM_BATCH_MAX_WAIT_MS", 5))
+BATCH_MAX_QUEUE  = int(os.environ.get("PALM_BATCH_MAX_QUEUE", 256))
+PREDICT_TIMEOUT_S = float(os.environ.get("PALM_PREDICT_TIMEOUT_S", 30))
+BATCH_MAX_FILES  = int(os.environ.get("PALM_BATCH_MAX_FILES", 64))
+# auto | numpy | keras
+MODEL_BACKEND    = os.environ.get("PALM_BACKEND", "auto")
+# map weights read-only (chia sẻ qua page cache giữa các worker, xem gunicorn.conf.py)
+MMAP_WEIGHTS     = os.environ.get("PALM_MMAP_WEIGHTS", "1") != "0"
+# số thread tính toán của mỗi worker (gunicorn.conf.py đặt = số core / số worker)
+INTRA_OP_THREADS = int(os.environ.get("PALM_INTRA_OP_THREADS", 0)) or None
+# cache output thô của model theo hash ảnh upload; sqlite = dùng chung giữa các worker
+CACHE_BACKEND    = os.environ.get("PALM_CACHE_BACKEND", "memory")   # memory | sqlite | none
+CACHE_MAX_MB     = float(os.environ.get("PALM_CACHE_MAX_MB", 64))
+CACHE_TTL_S      = float(os.environ.get("PALM_CACHE_TTL_S", 3600))
+CACHE_PATH       = os.environ.get("PALM_CACHE_PATH", "/tmp/palm_prediction_cache.sqlite")
+# admin endpoints (/api/admin/*) chỉ bật khi có token; gửi qua header X-Admin-Token
+ADMIN_TOKEN      = os.environ.get("PALM_ADMIN_TOKEN")
+# profile N request đầu tiên sau khi khởi động (0 = tắt); file .folded ghi vào PROFILE_DIR
+PROFILE_REQUESTS = int(os.environ.get("PALM_PROFILE_REQUESTS", 0))
+PROFILE_DIR      = os.environ.get("PALM_PROFILE_DIR", "profiles")
+# kiểm tra model/CURRENT mỗi N giây và nạp lại khi đổi (0 = chỉ qua /api/admin/reload)
+MODEL_WATCH_S    = float(os.environ.get("PALM_MODEL_WATCH_S", 10))
 BASE = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR = os.path.join(BASE,"model")
 WEB_DIR   = os.path.join(BASE,"web")
 
-model = keras.models.load_model(os.path.join(MODEL_DIR, "model.h5"))
-LABELS = [l.strip() for l in open(os.path.join(MODEL_DIR,"labels.txt"),"r",encoding="utf-8").read().splitlines() if l.strip()]
-ATTR_CFG = json.load(open(os.path.join(MODEL_DIR,"attr_config.json"),"r",encoding="utf-8"))
+pred_cache = make_prediction_cache(CACHE_BACKEND, int(CACHE_MAX_MB * 2**20), CACHE_TTL_S, CACHE_PATH)
+
+# --- metrics (Prometheus text tại /metrics)
+REQUESTS       = REGISTRY.counter("palm_requests_total", "API requests by endpoint, HTTP status and model version",
+                                  ["endpoint", "status", "model_version"])
+REQUEST_SECONDS = REGISTRY.histogram("palm_request_seconds", "End-to-end handler time (excluding upload)", ["endpoint"])
+STAGE_SECONDS  = REGISTRY.histogram("palm_stage_seconds", "Time spent per prediction stage", ["stage"])
+ERRORS         = REGISTRY.counter("palm_errors_total", "Failed predictions by reason", ["reason"])
+REJECTED_LINE_TYPE = REGISTRY.counter("palm_rejected_line_type_total", "Requests with an unknown line_type")
+BATCH_ROWS     = REGISTRY.histogram("palm_batch_rows", "Rows per model forward pass", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+BATCH_SECONDS  = REGISTRY.histogram("palm_batch_seconds", "Model forward pass time per batch")
+RELOADS        = REGISTRY.counter("palm_model_reloads_total", "Model reload attempts by result", ["result"])
+BATCH_REJECTED = REGISTRY.counter("palm_batch_rejected_total", "Requests rejected because the batcher queue was full")
+PROFILER = SamplingProfiler(PROFILE_DIR)
+if PROFILE_REQUESTS > 0:
+    PROFILER.arm(PROFILE_REQUESTS)
+
+def _on_batch(rows, seconds):
+    BATCH_ROWS.observe(rows); BATCH_SECONDS.observe(seconds)
+
+def _on_reload(result, version, seconds):
+    RELOADS.inc(result=result)
+
+# TensorFlow chỉ được import khi chưa có artifact serving/ (xem numpy_backend.py)
+models = ModelManager(MODEL_DIR,
+                      load_kwargs=dict(batch_size=BATCH_MAX_SIZE, backend=MODEL_BACKEND,
+                                       mmap=MMAP_WEIGHTS, intra_op_threads=INTRA_OP_THREADS),
+                      batcher_kwargs=dict(max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                                          max_queue=BATCH_MAX_QUEUE, on_batch=_on_batch,
+                                          worker_context=lambda: PROFILER.thread("batch")),
+                      on_reload=_on_reload)
+models.watch(MODEL_WATCH_S)
+
+def _cache_stat(field):
+    return lambda: pred_cache.stats()[field] if pred_cache else None
+
+REGISTRY.gauge("palm_model_info", "Live model (value is always 1)", ["version", "backend"],
+               fn=lambda: {(models.current.version, models.current.backend): 1})
+REGISTRY.gauge("palm_model_draining", "Retired model versions still finishing requests", fn=lambda: models.draining)
+REGISTRY.gauge("palm_batch_queue_depth", "Requests waiting for the micro-batcher",
+               fn=lambda: models.current.batcher.queue_depth())
+REGISTRY.gauge("palm_batch_queue_capacity", "Micro-batcher queue bound", fn=lambda: BATCH_MAX_QUEUE)
+REGISTRY.gauge("palm_prediction_cache_hits", "Prediction cache hits (this process)", fn=_cache_stat("hits"))
+REGISTRY.gauge("palm_prediction_cache_misses", "Prediction cache misses (this process)", fn=_cache_stat("misses"))
+REGISTRY.gauge("palm_prediction_cache_entries", "Entries in the prediction cache", fn=_cache_stat("entries"))
+REGISTRY.gauge("palm_prediction_cache_bytes", "Bytes stored in the prediction cache", fn=_cache_stat("bytes"))
+# model đã được chạy thử (warm-up) trong ModelManager trước khi nhận request
+_m = models.current
+STARTUP = {"backend": _m.backend, "warmup_ms": _m.warmup_ms, "pid": os.getpid(),
+           "mmap_weights": MMAP_WEIGHTS and _m.backend == "numpy", "intra_op_threads": INTRA_OP_THREADS,
+           "time_to_ready_ms": (time.perf_counter() - _T_START) * 1000.0}
+print(f"[startup] model={_m.version} backend={_m.backend} warm-up={_m.warmup_ms:.1f}ms "
+      f"ready after {STARTUP['time_to_ready_ms']:.0f}ms")
 
 app = Flask(__name__, static_folder=WEB_DIR, template_folder=WEB_DIR)
 
-def preprocess(img: Image.Image):
-    im = img.convert("L").resize((IMG_SIZE,IMG_SIZE))
-    arr = np.asarray(im, dtype=np.float32)/255.0
-    return arr.flatten()[None,:]
+ERR_REQUIRED = "file và line_type (life|heart|head|fate) là bắt buộc"
+
+def error_message(reason, message):
+    ERRORS.inc(reason=reason)
+    return message
+
+def fail(reason, message, status):
+    return {"error": error_message(reason, message)}, status
+
+def count_request(endpoint, status, model_version=""):
+    """Chỗ duy nhất tăng palm_requests_total, để mọi lần đếm có đủ bộ label"""
+    REQUESTS.inc(endpoint=endpoint, status=status, model_version=model_version)
+
+def missing_fields(endpoint):
+    """400 cho request thiếu file/line_type (bị chặn trước khi tới predict_one)"""
+    count_request(endpoint, 400)
+    return fail("missing_fields", ERR_REQUIRED, 400)
+
+def run_batched(model, X):
+    """Gửi X qua batcher của model; trả về (preds, None) hoặc (None, (body, status))"""
+    try:
+        with STAGE_SECONDS.time(stage="predict"):
+            return model.batcher.submit(X, timeout=PREDICT_TIMEOUT_S), None
+    except QueueFullError:
+        BATCH_REJECTED.inc()
+        return None, fail("overloaded", "máy chủ đang quá tải, vui lòng thử lại sau", 503)
+    except TimeoutError:
+        return None, fail("timeout", "quá thời gian xử lý dự đoán", 504)
+
+def cached_heads(model, data):
+    """(key, heads) — heads là output thô đã cache cho ảnh này (với version của model), hoặc None"""
+    if pred_cache is None:
+        return None, None
+    with STAGE_SECONDS.time(stage="cache_lookup"):
+        key = cache_key(data, model.version)
+        return key, pred_cache.get(key)
+
+def decode(model, data):
+    """bytes -> pixel uint8, đúng cách đã xử lý dữ liệu train (raise ImageTooLargeError / OSError / ValueError)"""
+    with STAGE_SECONDS.time(stage="decode"):
+        return model.preprocessor.pixels(data)
+
+def instrumented(endpoint):
+    """Đo thời gian, đếm status và (nếu bật) profile cho 1 hàm xử lý trả về (body, status)"""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            with PROFILER.track(endpoint), REQUEST_SECONDS.time(endpoint=endpoint):
+                body, status = fn(*args)
+            count_request(endpoint, status, body.get("model_version", ""))
+            return body, status
+        return wrapper
+    return deco
+
+# --- phần xử lý không phụ thuộc framework: dùng chung cho Flask (app.py) và ASGI (asgi.py)
+# mỗi hàm trả về (body dict, http status); cả request dùng đúng 1 version model
+
+@instrumented("predict")
+def predict_one(data, line_type):
+    with models.use() as model:
+        body, status = _predict_one(model, data, line_type)
+    body["model_version"] = model.version
+    return body, status
 
-def argmax_and_name(arr, names):
-    idx = int(np.argmax(arr)); return names[idx], float(arr[idx])
+def _predict_one(model, data, line_type):
+    line_type = line_type.strip().lower()
+    if line_type not in model.labels:
+        REJECTED_LINE_TYPE.inc()
+        return fail("invalid_line_type", "line_type không hợp lệ", 400)
+    key, preds = cached_heads(model, data)
+    if preds is None:
+        try:
+            pixels = decode(model, data)
+        except ImageTooLargeError:
+            return fail("image_too_large", "ảnh quá lớn", 413)
+        except (OSError, ValueError):
+            return fail("bad_image", "không đọc được ảnh", 400)
+        with STAGE_SECONDS.time(stage="preprocess"):
+            # buffer riêng của thread: submit() chặn cho tới khi batch chạy xong
+            X = normalize(pixels[None,:], out=model.preprocessor.buffer())
+        preds, err = run_batched(model, X)
+        if err: return err
+        if key: pred_cache.put(key, preds)
+    with STAGE_SECONDS.time(stage="interpret"):
+        pred = unpack_attributes(preds, model.attr_cfg)
+        # dùng line_type người dùng chọn để diễn giải (ưu tiên user choice)
+        expl = interpret(line_type, pred)
+    return {"attributes": pred, "line_type_input": line_type, "interpretation": expl}, 200
+
+@instrumented("predict_batch")
+def predict_many(uploads, line_types):
+    """uploads: list (filename, bytes); line_types: cùng độ dài hoặc 1 giá trị dùng chung"""
+    with models.use() as model:
+        body, status = _predict_many(model, uploads, line_types)
+    body["model_version"] = model.version
+    return body, status
+
+def _predict_many(model, uploads, line_types):
+    line_types = [t.strip().lower() for t in line_types]
+    if not uploads or not line_types:
+        return fail("missing_fields", ERR_REQUIRED, 400)
+    if len(uploads) > BATCH_MAX_FILES:
+        return fail("too_many_files", f"tối đa {BATCH_MAX_FILES} ảnh mỗi request", 413)
+    if len(line_types) == 1:
+        line_types = line_types * len(uploads)
+    if len(line_types) != len(uploads):
+        return fail("line_type_count", "số line_type phải bằng số file (hoặc chỉ 1)", 400)
+
+    results = [{"filename": name, "line_type_input": t} for (name, _), t in zip(uploads, line_types)]
+    heads = {}                      # i -> output thô (từ cache hoặc từ batch)
+    rows, todo = [], []             # ảnh chưa có trong cache
+    for i, ((_, data), t) in enumerate(zip(uploads, line_types)):
+        if t not in model.labels:
+            REJECTED_LINE_TYPE.inc()
+            results[i]["error"] = error_message("invalid_line_type", "line_type không hợp lệ"); continue
+        key, hit = cached_heads(model, data)
+        if hit is not None:
+            heads[i] = hit; continue
+        try:
+            rows.append(decode(model, data))
+        except ImageTooLargeError:
+            results[i]["error"] = error_message("image_too_large", "ảnh quá lớn"); continue
+        except (OSError, ValueError):
+            results[i]["error"] = error_message("bad_image", "không đọc được ảnh"); continue
+        todo.append((i, key))
+
+    if todo:
+        with STAGE_SECONDS.time(stage="preprocess"):
+            X = normalize(np.stack(rows))
+        preds, err = run_batched(model, X)
+        if err: return err
+        for row, (i, key) in enumerate(todo):
+            heads[i] = [h[row:row+1] for h in preds]
+            if key: pred_cache.put(key, heads[i])
+    with STAGE_SECONDS.time(stage="interpret"):
+        for i, h in heads.items():
+            pred = unpack_attributes(h, model.attr_cfg)
+            results[i]["attributes"] = pred
+            results[i]["interpretation"] = interpret(results[i]["line_type_input"], pred)
+    return {"results": results}, 200
+
+def stats_payload():
+    model = models.current
+    return {"batching": model.batcher.stats(), "startup": STARTUP, "model_version": model.version,
+            "model": models.status(), "prediction_cache": pred_cache.stats() if pred_cache else None}
+
+def health_payload():
+    model = models.current
+    return {"status": "ok", "backend": model.backend, "model_version": model.version}
+
+def metrics_text():
+    return REGISTRY.render()
+
+def admin_authorized(token):
+    return bool(ADMIN_TOKEN) and token == ADMIN_TOKEN
+
+def start_profile(num_requests, interval_ms=None):
+    """Bật sampling profiler cho num_requests request tiếp theo"""
+    started = PROFILER.arm(num_requests, interval_ms / 1000.0 if interval_ms else None)
+    return {"started": started, **PROFILER.status()}, (200 if started else 409)
+
+def start_reload(wait=False):
+    """Nạp lại model theo model/CURRENT (chỉ worker nhận request này; các worker khác dùng watch)"""
+    started = models.reload(block=wait)
+    if not started:
+        return {"started": False, **models.status()}, 409
+    return {"started": True, **models.status()}, (200 if wait else 202)
 
 @app.route("/")
 def index():
@@ -35,25 +273,49 @@ def static_files(p):
 
 @app.route("/api/predict", methods=["POST"])
 def api_predict():
-    if "file" not in request.files or "line_type" not in request.form:
-        return jsonify({"error":"file và line_type (life|heart|head|fate) là bắt buộc"}), 400
-    line_type = request.form["line_type"].strip().lower()
-    if line_type not in LABELS:
-        return jsonify({"error":"line_type không hợp lệ"}), 400
-    img = Image.open(io.BytesIO(request.files["file"].read()))
-    X = preprocess(img)
-    preds = model.predict(X, verbose=0)
-    # unpack theo thứ tự outputs trong train_multihead.py
-    pred = {
-        "line_type": argmax_and_name(preds[0][0], ATTR_CFG["line_type"])[0],
-        "length_cls": argmax_and_name(preds[1][0], ATTR_CFG["length_cls"])[0],
-        "slope_cls":  argmax_and_name(preds[2][0], ATTR_CFG["slope_cls"])[0],
-        "curv_cls":   argmax_and_name(preds[3][0], ATTR_CFG["curv_cls"])[0],
-        "breaks_cls": argmax_and_name(preds[4][0], ATTR_CFG["breaks_cls"])[0],
-    }
-    # dùng line_type người dùng chọn để diễn giải (ưu tiên user choice)
-    expl = interpret(line_type, pred)
-    return jsonify({"attributes": pred, "line_type_input": line_type, "interpretation": expl})
+    with STAGE_SECONDS.time(stage="upload"):
+        ok = "file" in request.files and "line_type" in request.form
+        data = request.files["file"].read() if ok else None
+    if not ok:
+        body, status = missing_fields("predict")
+        return jsonify(body), status
+    body, status = predict_one(data, request.form["line_type"])
+    return jsonify(body), status
+
+@app.route("/api/predict_batch", methods=["POST"])
+def api_predict_batch():
+    # nhiều field "file" + "line_type" theo cùng thứ tự (hoặc 1 line_type dùng chung)
+    with STAGE_SECONDS.time(stage="upload"):
+        uploads = [(f.filename, f.read()) for f in request.files.getlist("file")]
+    body, status = predict_many(uploads, request.form.getlist("line_type"))
+    return jsonify(body), status
+
+@app.route("/api/stats")
+def api_stats():
+    return jsonify(stats_payload())
+
+@app.route("/api/health")
+def api_health():
+    return jsonify(health_payload())
+
+@app.route("/metrics")
+def metrics():
+    return metrics_text(), 200, {"Content-Type": METRICS_CONTENT_TYPE}
+
+@app.route("/api/admin/profile", methods=["POST"])
+def api_admin_profile():
+    if not admin_authorized(request.headers.get("X-Admin-Token")):
+        return jsonify({"error":"forbidden"}), 403
+    body, status = start_profile(request.args.get("requests", 20, type=int),
+                                 request.args.get("interval_ms", type=float))
+    return jsonify(body), status
+
+@app.route("/api/admin/reload", methods=["POST"])
+def api_admin_reload():
+    if not admin_authorized(request.headers.get("X-Admin-Token")):
+        return jsonify({"error":"forbidden"}), 403
+    body, status = start_reload(wait=request.args.get("wait", "0") not in ("0", "false", ""))
+    return jsonify(body), status
 
 if __name__ == "__main__":
     app.run(host="127.0.0.1", port=5000, debug=True)
@@ -0,0 +1,131 @@
+"""Chế độ phục vụ async (ASGI) — cùng API /api/predict như app.py.
+
+Kết nối/upload được xử lý trên event loop; decode ảnh + model + interpret chạy
+trong thread pool giới hạn, nên upload chậm từ mobile không giữ chỗ của phần suy luận.
+Khi pool đã đầy -> 429; quá thời gian -> 504; khi tắt server thì chờ các job đang chạy.
+
+    uvicorn asgi:app --host 127.0.0.1 --port 5000
+"""
+import os
+import asyncio
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route, Mount
+from starlette.staticfiles import StaticFiles
+
+import app as core
+
+# số job CPU chạy song song và số job tối đa được nhận (chạy + chờ) trước khi trả 429
+ASGI_WORKERS      = int(os.environ.get("PALM_ASGI_WORKERS", os.cpu_count() or 4))
+ASGI_MAX_INFLIGHT = int(os.environ.get("PALM_ASGI_MAX_INFLIGHT", 4 * ASGI_WORKERS))
+REQUEST_TIMEOUT_S = float(os.environ.get("PALM_REQUEST_TIMEOUT_S", 30))
+
+executor = ThreadPoolExecutor(max_workers=ASGI_WORKERS, thread_name_prefix="palm-cpu")
+_inflight = 0
+
+
+async def offload(fn, *args):
+    """Chạy fn trong pool với backpressure + timeout; trả về JSONResponse"""
+    global _inflight
+    if _inflight >= ASGI_MAX_INFLIGHT:
+        core.ERRORS.inc(reason="asgi_overloaded")
+        return JSONResponse({"error":"máy chủ đang quá tải, vui lòng thử lại sau"}, status_code=429,
+                            headers={"Retry-After": "1"})
+    _inflight += 1
+    future = asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+    def _done(_):
+        # chỉ giảm khi job thật sự xong (job bị timeout vẫn đang chiếm CPU)
+        global _inflight
+        _inflight -= 1
+    future.add_done_callback(_done)
+
+    try:
+        body, status = await asyncio.wait_for(asyncio.shield(future), REQUEST_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        core.ERRORS.inc(reason="asgi_timeout")
+        return JSONResponse({"error":"quá thời gian xử lý dự đoán"}, status_code=504)
+    return JSONResponse(body, status_code=status)
+
+
+async def api_predict(request):
+    with core.STAGE_SECONDS.time(stage="upload"):
+        form = await request.form(max_files=1)
+        upload, line_type = form.get("file"), form.get("line_type")
+        ok = upload is not None and hasattr(upload, "read") and line_type is not None
+        data = await upload.read() if ok else None
+    if not ok:
+        body, status = core.missing_fields("predict")
+        return JSONResponse(body, status_code=status)
+    return await offload(core.predict_one, data, line_type)
+
+
+async def api_predict_batch(request):
+    with core.STAGE_SECONDS.time(stage="upload"):
+        form = await request.form(max_files=core.BATCH_MAX_FILES + 1)
+        files = [f for f in form.getlist("file") if hasattr(f, "read")]
+        uploads = [(f.filename, await f.read()) for f in files]
+    return await offload(core.predict_many, uploads, form.getlist("line_type"))
+
+
+async def api_stats(request):
+    payload = core.stats_payload()
+    payload["asgi"] = {"workers": ASGI_WORKERS, "max_inflight": ASGI_MAX_INFLIGHT, "inflight": _inflight}
+    return JSONResponse(payload)
+
+
+async def api_health(request):
+    return JSONResponse(core.health_payload())
+
+
+async def metrics(request):
+    return Response(core.metrics_text(), media_type=core.METRICS_CONTENT_TYPE)
+
+
+async def api_admin_reload(request):
+    if not core.admin_authorized(request.headers.get("x-admin-token")):
+        return JSONResponse({"error":"forbidden"}, status_code=403)
+    wait = request.query_params.get("wait", "0") not in ("0", "false", "")
+    if wait:
+        body, status = await asyncio.get_running_loop().run_in_executor(None, core.start_reload, True)
+    else:
+        body, status = core.start_reload()
+    return JSONResponse(body, status_code=status)
+
+
+async def api_admin_profile(request):
+    if not core.admin_authorized(request.headers.get("x-admin-token")):
+        return JSONResponse({"error":"forbidden"}, status_code=403)
+    try:
+        num_requests = int(request.query_params.get("requests", 20))
+        interval_ms = float(request.query_params["interval_ms"]) if "interval_ms" in request.query_params else None
+    except ValueError:
+        return JSONResponse({"error":"requests/interval_ms không hợp lệ"}, status_code=400)
+    body, status = core.start_profile(num_requests, interval_ms)
+    return JSONResponse(body, status_code=status)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    yield
+    # graceful shutdown: không nhận job mới, chờ job đang chạy rồi xả batcher
+    await asyncio.get_running_loop().run_in_executor(None, executor.shutdown, True)
+    core.models.close()
+
+
+app = Starlette(
+    routes=[
+        Route("/api/predict", api_predict, methods=["POST"]),
+        Route("/api/predict_batch", api_predict_batch, methods=["POST"]),
+        Route("/api/stats", api_stats),
+        Route("/api/health", api_health),
+        Route("/metrics", metrics),
+        Route("/api/admin/profile", api_admin_profile, methods=["POST"]),
+        Route("/api/admin/reload", api_admin_reload, methods=["POST"]),
+        Mount("/", StaticFiles(directory=core.WEB_DIR, html=True)),
+    ],
+    lifespan=lifespan,
+)
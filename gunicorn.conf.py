@@ -0,0 +1,38 @@
+"""Pre-fork serving: N worker processes sharing one copy of the model weights.
+
+    gunicorn -c gunicorn.conf.py app:app
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+
+Each worker imports app.py after the fork and maps model/serving/*.npy
+read-only (PALM_MMAP_WEIGHTS=1), so the kernels live once in the OS page
+cache no matter how many workers run; only code, buffers and caches are per
+worker. Use PALM_CACHE_BACKEND=sqlite to share the prediction cache too.
+
+The app is deliberately not preloaded in the master: the micro-batcher
+thread and TensorFlow's thread pools do not survive fork().
+
+Every worker gets cores // workers BLAS/OpenMP threads (override with
+PALM_INTRA_OP_THREADS) so N workers do not oversubscribe the CPU. This
+must be decided here, before any worker imports NumPy.
+"""
+import os
+
+workers = int(os.environ.get("PALM_WORKERS", min(4, os.cpu_count() or 1)))
+# request threads per worker: concurrent requests feed the micro-batcher
+worker_class = os.environ.get("PALM_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("PALM_WORKER_REQUEST_THREADS", 8))
+bind = os.environ.get("PALM_BIND", "127.0.0.1:5000")
+timeout = int(os.environ.get("PALM_WORKER_TIMEOUT_S", 60))
+graceful_timeout = int(os.environ.get("PALM_GRACEFUL_TIMEOUT_S", 30))
+preload_app = False
+
+intra_op_threads = int(os.environ.get("PALM_INTRA_OP_THREADS", 0)) or max(1, (os.cpu_count() or 1) // workers)
+os.environ["PALM_INTRA_OP_THREADS"] = str(intra_op_threads)
+os.environ.setdefault("PALM_MMAP_WEIGHTS", "1")
+for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS"):
+    os.environ.setdefault(var, str(intra_op_threads))
+
+
+def when_ready(server):
+    server.log.info("%d workers x %d compute threads, mmap weights=%s",
+                    workers, intra_op_threads, os.environ["PALM_MMAP_WEIGHTS"])
@@ -0,0 +1,183 @@
+import contextlib
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the batcher queue is at capacity"""
+
+
+class _PendingRequest:
+    def __init__(self, X):
+        self.X = X
+        self.rows = X.shape[0]
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """Collect concurrent predict calls into a single forward pass.
+
+    Requests arriving within ``max_wait_ms`` of the first queued request are
+    stacked (up to ``max_batch_size`` rows) and sent to ``predict_fn`` at once.
+    Each caller gets back its own slice of every output head.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0, max_queue=256, on_batch=None,
+                 worker_context=None):
+        self.predict_fn = predict_fn
+        # optional hook(rows, seconds) called after every batch, e.g. for metrics
+        self.on_batch = on_batch
+        # optional callable returning a context manager the worker thread runs in,
+        # e.g. to register the thread with a profiler
+        self.worker_context = worker_context
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'batches': 0,
+            'requests': 0,
+            'rows': 0,
+            'rejected': 0,
+            'errors': 0,
+            'last_batch_size': 0,
+            'last_batch_ms': 0.0,
+            'max_batch_ms': 0.0,
+            'total_batch_ms': 0.0,
+            'total_wait_ms': 0.0,
+        }
+
+        self._worker = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, X, timeout=None):
+        """Queue ``X`` (rows x features) and block until its outputs are ready"""
+        req = _PendingRequest(X)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            if len(self._queue) >= self.max_queue:
+                with self._stats_lock:
+                    self._stats['rejected'] += 1
+                raise QueueFullError(f"prediction queue is full ({self.max_queue} pending)")
+            self._queue.append(req)
+            self._cond.notify()
+
+        if not req.done.wait(timeout):
+            raise TimeoutError("prediction timed out waiting for batch")
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def stats(self):
+        """Snapshot of batching metrics"""
+        with self._stats_lock:
+            s = dict(self._stats)
+        batches = s['batches'] or 1
+        s['avg_batch_size'] = s['rows'] / batches
+        s['avg_batch_ms'] = s['total_batch_ms'] / batches
+        s['avg_wait_ms'] = s['total_wait_ms'] / (s['requests'] or 1)
+        s['queue_depth'] = self.queue_depth()
+        s['max_batch_size'] = self.max_batch_size
+        s['max_wait_ms'] = self.max_wait * 1000.0
+        s['max_queue'] = self.max_queue
+        return s
+
+    def close(self, drain=True):
+        """Stop the worker; with ``drain`` pending requests are served first"""
+        with self._cond:
+            self._closed = True
+            if not drain:
+                while self._queue:
+                    req = self._queue.popleft()
+                    req.error = RuntimeError("MicroBatcher closed")
+                    req.done.set()
+            self._cond.notify_all()
+        self._worker.join()
+
+    def _collect(self):
+        """Wait for the first request, then gather more until the window ends"""
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if not self._queue:
+                return []
+
+            batch = [self._queue.popleft()]
+            rows = batch[0].rows
+            deadline = batch[0].enqueued_at + self.max_wait
+            while rows < self.max_batch_size:
+                if not self._queue:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0 or self._closed:
+                        break
+                    self._cond.wait(remaining)
+                    continue
+                if rows + self._queue[0].rows > self.max_batch_size:
+                    break
+                req = self._queue.popleft()
+                batch.append(req)
+                rows += req.rows
+            return batch
+
+    def _run(self):
+        with self.worker_context() if self.worker_context is not None else contextlib.nullcontext():
+            while True:
+                batch = self._collect()
+                if not batch:
+                    return
+                self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        start = time.perf_counter()
+        try:
+            X = batch[0].X if len(batch) == 1 else np.concatenate([r.X for r in batch], axis=0)
+            outputs = self.predict_fn(X)
+            if not isinstance(outputs, (list, tuple)):
+                outputs = [outputs]
+            offset = 0
+            for req in batch:
+                req.result = [head[offset:offset + req.rows] for head in outputs]
+                offset += req.rows
+        except Exception as e:
+            for req in batch:
+                req.error = e
+            with self._stats_lock:
+                self._stats['errors'] += 1
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+
+        with self._stats_lock:
+            s = self._stats
+            s['batches'] += 1
+            s['requests'] += len(batch)
+            rows = sum(r.rows for r in batch)
+            s['rows'] += rows
+            s['last_batch_size'] = rows
+            s['last_batch_ms'] = elapsed_ms
+            s['max_batch_ms'] = max(s['max_batch_ms'], elapsed_ms)
+            s['total_batch_ms'] += elapsed_ms
+            s['total_wait_ms'] += sum((start - r.enqueued_at) * 1000.0 for r in batch)
+
+        if self.on_batch is not None:
+            try:
+                self.on_batch(rows, elapsed_ms / 1000.0)
+            except Exception:
+                pass
+
+        for req in batch:
+            req.done.set()
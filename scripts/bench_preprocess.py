@@ -0,0 +1,86 @@
+"""Per-image preprocessing latency: legacy full decode vs the draft-mode fast path.
+
+    python scripts/bench_preprocess.py --width 4000 --height 3000 --repeat 20
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.preprocessing import ImagePreprocessor, LEGACY_CONFIG
+
+# the 128x128 grayscale pipeline the legacy path below implements
+PREPROCESSOR = ImagePreprocessor.from_config(LEGACY_CONFIG)
+IMG_SIZE = PREPROCESSOR.image_size[0]
+
+
+def legacy_preprocess(data):
+    """The original app.py path: full-resolution decode, then convert/resize/cast"""
+    img = Image.open(io.BytesIO(data))
+    im = img.convert("L").resize((IMG_SIZE,IMG_SIZE))
+    arr = np.asarray(im, dtype=np.float32)/255.0
+    return arr.flatten()[None,:]
+
+
+def fast_preprocess(data):
+    return PREPROCESSOR.preprocess(data, out=PREPROCESSOR.buffer())
+
+
+def synthetic_photo(width, height, fmt='JPEG', seed=0):
+    """Smooth noise photo (compresses like a real one, unlike white noise)"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, fmt, quality=90)
+    return buf.getvalue()
+
+
+def time_per_call(fn, repeat):
+    fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.median(times))
+
+
+def run(width=4000, height=3000, fmt='JPEG', repeat=20, batch=16):
+    data = synthetic_photo(width, height, fmt)
+    results = {
+        'image': f"{width}x{height} {fmt} ({len(data) / 2**20:.1f} MiB)",
+        'legacy_ms': time_per_call(lambda: legacy_preprocess(data), repeat),
+        'fast_ms': time_per_call(lambda: fast_preprocess(data), repeat),
+        'fast_batch_ms_per_image': time_per_call(
+            lambda: PREPROCESSOR.preprocess_batch([data] * batch), max(1, repeat // 4)) / batch,
+    }
+    diff = np.abs(legacy_preprocess(data) - fast_preprocess(data)).max()
+    results['max_abs_diff'] = float(diff)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--format', default='JPEG', choices=['JPEG', 'PNG'])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--batch', type=int, default=16)
+    args = parser.parse_args()
+
+    r = run(args.width, args.height, args.format, args.repeat, args.batch)
+    print(f"Image: {r['image']}")
+    print(f"legacy preprocess:      {r['legacy_ms']:8.2f} ms/image")
+    print(f"fast preprocess:        {r['fast_ms']:8.2f} ms/image ({r['legacy_ms'] / r['fast_ms']:.1f}x)")
+    print(f"fast preprocess_batch:  {r['fast_batch_ms_per_image']:8.2f} ms/image")
+    print(f"max |legacy - fast|:    {r['max_abs_diff']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Per-call cost of interpret(): compiled lookup vs matching the rules on every call.
+
+    python scripts/bench_rules.py --repeat 200000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.inference import HEAD_NAMES
+from scripts.rule_engine import RuleEngine, RULES_PATH, ANY
+
+
+def scan_interpret(engine, line_type, pred):
+    """What interpret() would cost without the table: test every rule per aspect"""
+    key = (line_type, *(pred[name] for name in HEAD_NAMES[1:]))
+    reading, fired = {}, []
+    for aspect in engine.aspects:
+        best, best_n = None, -1
+        for rule in engine.rules:
+            if rule['aspect'] != aspect:
+                continue
+            when = rule.get('when', {})
+            if all(when.get(name, ANY) in (ANY, k) for name, k in zip(HEAD_NAMES, key)):
+                n = sum(v != ANY for v in when.values())
+                if n > best_n:
+                    best, best_n = rule, n
+        fired.append(best['id'])
+        if best.get('text') is not None:
+            reading[aspect] = best['text']
+    return {'reading': reading, 'rules': fired}
+
+
+def time_per_call(fn, calls, repeat):
+    """Mean ns per call over ``repeat`` calls, cycling through ``calls``"""
+    n = len(calls)
+    t0 = time.perf_counter()
+    for i in range(repeat):
+        fn(*calls[i % n])
+    return (time.perf_counter() - t0) / repeat * 1e9
+
+
+def run(path=RULES_PATH, repeat=200_000):
+    t0 = time.perf_counter()
+    engine = RuleEngine.load(path)
+    compile_ms = (time.perf_counter() - t0) * 1000.0
+    calls = [(key[0], dict(zip(HEAD_NAMES, key))) for key in engine.keys()]
+    for line_type, pred in calls:
+        if scan_interpret(engine, line_type, pred) != engine.interpret(line_type, pred):
+            raise AssertionError(f"compiled table disagrees with the rules for {line_type} {pred}")
+    return {
+        'rules': len(engine.rules),
+        'combinations': len(calls),
+        'compile_ms': compile_ms,
+        'lookup_ns': time_per_call(engine.interpret, calls, repeat),
+        'scan_ns': time_per_call(lambda t, p: scan_interpret(engine, t, p), calls, max(1, repeat // 20)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', default=RULES_PATH)
+    parser.add_argument('--repeat', type=int, default=200_000)
+    args = parser.parse_args()
+
+    r = run(args.rules, args.repeat)
+    print(f"{r['rules']} rules, {r['combinations']} combinations, compiled in {r['compile_ms']:.1f} ms")
+    print(f"compiled lookup:  {r['lookup_ns']:10.0f} ns/call")
+    print(f"rule scan:        {r['scan_ns']:10.0f} ns/call ({r['scan_ns'] / r['lookup_ns']:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
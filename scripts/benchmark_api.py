@@ -0,0 +1,279 @@
+"""Load test /api/predict and micro-benchmark each stage of the prediction path.
+
+In-process (Flask test client, loads model/ like app.py does):
+    python scripts/benchmark_api.py --requests 200 --concurrency 8 -o bench.json
+
+Against a running server (Flask, gunicorn or uvicorn asgi:app):
+    python scripts/benchmark_api.py --url http://127.0.0.1:5000 --concurrency 16
+
+Every load-test request uploads distinct bytes, so the prediction cache never
+hits and the numbers cover decode + predict; ``--warm-cache`` reuses the same
+few images instead to measure the cache-hit path.
+
+Compare with an earlier run:
+    python scripts/benchmark_api.py -o new.json --compare bench.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import resource
+import argparse
+import platform
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.bench_preprocess import synthetic_photo
+
+LINE_TYPES = ['life', 'heart', 'head', 'fate']
+# typical phone photo, webcam capture from web/app.js, small upload
+DEFAULT_SIZES = ['4032x3024', '1280x720', '640x480']
+
+
+def peak_rss_mb():
+    """Peak RSS of this process (the server too, when it runs in-process)"""
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (2**20 if platform.system() == 'Darwin' else 2**10)
+
+
+def _child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(c) for c in f.read().split()]
+    except OSError:
+        return []
+    return children + [g for c in children for g in _child_pids(c)]
+
+
+def server_peak_rss_mb(pid):
+    """Summed peak RSS (VmHWM) of a server process and its workers, from /proc (Linux only)"""
+    total_kb = 0
+    for p in [pid] + _child_pids(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                total_kb += next((int(line.split()[1]) for line in f if line.startswith('VmHWM:')), 0)
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+def percentiles(samples_ms):
+    if not samples_ms:
+        return {}
+    arr = np.asarray(samples_ms)
+    return {
+        'count': int(arr.size),
+        'mean_ms': float(arr.mean()),
+        'p50_ms': float(np.percentile(arr, 50)),
+        'p95_ms': float(np.percentile(arr, 95)),
+        'p99_ms': float(np.percentile(arr, 99)),
+        'max_ms': float(arr.max()),
+    }
+
+
+def make_images(sizes, per_size, fmt='JPEG'):
+    images = []
+    for size in sizes:
+        w, h = (int(v) for v in size.lower().split('x'))
+        for seed in range(per_size):
+            images.append((f"palm_{size}_{seed}.jpg", synthetic_photo(w, h, fmt, seed=seed)))
+    return images
+
+
+def multipart_body(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def http_poster(url):
+    def post(filename, data, line_type):
+        body, content_type = multipart_body([('line_type', line_type)], [('file', filename, data)])
+        req = urllib.request.Request(url.rstrip('/') + '/api/predict', data=body,
+                                     headers={'Content-Type': content_type})
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                resp.read()
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    return post
+
+
+def test_client_poster(client):
+    def post(filename, data, line_type):
+        resp = client.post('/api/predict', data={'file': (io.BytesIO(data), filename), 'line_type': line_type})
+        return resp.status_code
+    return post
+
+
+def unique_upload(data, i):
+    """Same image, different bytes: decoders ignore data after the end marker, the cache key does not"""
+    return data + f"#{i}".encode()
+
+
+def load_test(post, images, num_requests, concurrency, warm_cache=False):
+    """Fire num_requests at the given concurrency; returns latency/throughput summary"""
+    latencies, statuses = [], {}
+
+    def one(i):
+        filename, data = images[i % len(images)]
+        if not warm_cache:
+            data = unique_upload(data, i)
+        t0 = time.perf_counter()
+        status = post(filename, data, LINE_TYPES[i % len(LINE_TYPES)])
+        return status, (time.perf_counter() - t0) * 1000.0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for status, ms in pool.map(one, range(num_requests)):
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 200:
+                latencies.append(ms)
+    elapsed = time.perf_counter() - start
+
+    summary = percentiles(latencies)
+    summary.update(requests=num_requests, concurrency=concurrency, warm_cache=warm_cache, elapsed_s=elapsed,
+                   throughput_rps=len(latencies) / elapsed if elapsed > 0 else 0.0, status_counts=statuses)
+    return summary
+
+
+def time_stage(fn, repeat):
+    fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return percentiles(samples)
+
+
+def stage_benchmarks(core, images, repeat, batch_size):
+    """Time each hot path on its own, outside HTTP"""
+    from scripts.inference import unpack_attributes
+
+    model = core.models.current
+    prep = model.preprocessor
+    stages = {}
+    for filename, data in images[::max(1, len(images) // len(DEFAULT_SIZES))]:
+        w, h = Image.open(io.BytesIO(data)).size
+        tag = f"{w}x{h}"
+        stages[f"Image.open[{tag}]"] = time_stage(lambda: Image.open(io.BytesIO(data)), repeat)
+        stages[f"decode_resize[{tag}]"] = time_stage(lambda: prep.pixels(data), repeat)
+        stages[f"preprocess[{tag}]"] = time_stage(lambda: prep.preprocess(data), repeat)
+
+    X1 = prep.preprocess(images[0][1])
+    XB = np.repeat(X1, batch_size, axis=0)
+    stages['model.predict[batch=1]'] = time_stage(lambda: model.predict_fn(X1), repeat)
+    stages[f'model.predict[batch={batch_size}]'] = time_stage(lambda: model.predict_fn(XB), repeat)
+    pred = unpack_attributes(model.predict_fn(X1), model.attr_cfg)
+    stages['interpret'] = time_stage(lambda: core.interpret('life', pred), repeat * 10)
+    return stages
+
+
+def compare(current, previous):
+    """Print p50/p95 deltas for every key present in both runs"""
+    def rows(result):
+        out = {}
+        if result.get('load_test'):
+            out['load_test'] = result['load_test']
+        out.update(result.get('stages', {}))
+        return out
+
+    cur, prev = rows(current), rows(previous)
+    print(f"\n{'metric':40s} {'p50 prev':>10s} {'p50 now':>10s} {'delta':>8s}")
+    for key in cur:
+        if key in prev and 'p50_ms' in cur[key] and 'p50_ms' in prev[key]:
+            a, b = prev[key]['p50_ms'], cur[key]['p50_ms']
+            delta = (b - a) / a * 100 if a else 0.0
+            print(f"{key:40s} {a:10.2f} {b:10.2f} {delta:+7.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the prediction API')
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process test client')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='image sizes as WxH')
+    parser.add_argument('--images-per-size', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=20, help='iterations per stage benchmark')
+    parser.add_argument('--batch-size', type=int, default=32, help='batch size for the model.predict stage')
+    parser.add_argument('--no-stages', action='store_true')
+    parser.add_argument('--no-load-test', action='store_true')
+    parser.add_argument('--warm-cache', action='store_true',
+                        help='repeat the same images so requests hit the prediction cache')
+    parser.add_argument('--server-pid', type=int,
+                        help='with --url: report the peak RSS of this server process and its workers')
+    parser.add_argument('--disable-cache', action='store_true',
+                        help='set PALM_CACHE_BACKEND=none for the in-process app (measure cold path)')
+    parser.add_argument('-o', '--output', help='write results as JSON')
+    parser.add_argument('--compare', help='previous JSON result to diff against')
+    args = parser.parse_args()
+
+    images = make_images(args.sizes, args.images_per_size)
+    result = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'cpu_count': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+    }
+
+    core = None
+    if not args.url:
+        if args.disable_cache:
+            os.environ['PALM_CACHE_BACKEND'] = 'none'
+        t0 = time.perf_counter()
+        import app as core
+        result['startup_s'] = time.perf_counter() - t0
+        result['backend'] = core.models.current.backend
+        result['model_version'] = core.models.current.version
+
+    if not args.no_load_test:
+        post = http_poster(args.url) if args.url else test_client_poster(core.app.test_client())
+        result['load_test'] = load_test(post, images, args.requests, args.concurrency, args.warm_cache)
+        lt = result['load_test']
+        print(f"load test: {lt['requests']} requests @ concurrency {lt['concurrency']}: "
+              f"{lt['throughput_rps']:.1f} req/s, p50 {lt.get('p50_ms', 0):.1f} ms, "
+              f"p95 {lt.get('p95_ms', 0):.1f} ms, p99 {lt.get('p99_ms', 0):.1f} ms, statuses {lt['status_counts']}")
+
+    if core is not None and not args.no_stages:
+        result['stages'] = stage_benchmarks(core, images, args.repeat, args.batch_size)
+        for name, s in result['stages'].items():
+            print(f"{name:40s} p50 {s['p50_ms']:9.3f} ms   p95 {s['p95_ms']:9.3f} ms")
+
+    if core is not None:
+        result['peak_rss_mb'] = peak_rss_mb()
+        print(f"peak RSS: {result['peak_rss_mb']:.0f} MB")
+    else:
+        result['client_peak_rss_mb'] = peak_rss_mb()
+        print(f"peak RSS of this benchmark client: {result['client_peak_rss_mb']:.0f} MB")
+        if args.server_pid:
+            result['server_peak_rss_mb'] = server_peak_rss_mb(args.server_pid)
+            print(f"peak RSS of server pid {args.server_pid} + workers: {result['server_peak_rss_mb']:.0f} MB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
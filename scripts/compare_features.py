@@ -0,0 +1,103 @@
+"""Compare feature-reduction settings side by side: size, speed and accuracy.
+
+    python scripts/compare_features.py --data-path data --specs none gray+pool4 pool2+pca256 edges+pool4
+
+For each spec (see scripts/features.py) this fits the reducer on the training
+split and trains the Dense stack for ``--epochs`` epochs with identical
+settings. It then reports:
+  - the feature count and the trainable parameter count;
+  - the reducer fit time;
+  - training samples/sec;
+  - the best validation accuracy;
+  - serving latency: reducer plus NumPy forward pass on one preprocessed
+    image and on a batch.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.train import PalmistryANNTrainer
+from scripts.numpy_backend import export_dense_model, NumpyDenseModel
+from scripts.benchmark_api import percentiles
+
+
+def serving_latency(trainer, X_val, repeat, batch_size):
+    """p50 ms of reducer + NumPy forward for 1 row and for ``batch_size`` rows"""
+    with tempfile.TemporaryDirectory() as tmp:
+        export_dense_model(trainer.model, tmp)
+        model = NumpyDenseModel.load(tmp)
+    predict = trainer.reducer.wrap(model.predict) if trainer.reducer else model.predict
+    rows = np.asarray(X_val[:batch_size], dtype=np.float32)
+    if X_val.dtype == np.uint8:
+        rows *= np.float32(1.0 / 255.0)
+    out = {}
+    for name, X in (('batch1', rows[:1]), (f'batch{len(rows)}', rows)):
+        predict(X)
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            predict(X)
+            samples.append((time.perf_counter() - t0) * 1000.0)
+        out[name] = percentiles(samples)['p50_ms']
+    return out
+
+
+def evaluate_spec(spec, data_path, epochs, batch_size, repeat):
+    with tempfile.TemporaryDirectory() as out_dir:
+        trainer = PalmistryANNTrainer(data_path, out_dir)
+        X_train, y_train, X_val_raw, y_val = trainer.load_data(mmap=True)
+        fit_s = 0.0
+        X_val = X_val_raw
+        if spec != 'none':
+            t0 = time.perf_counter()
+            trainer.fit_feature_reducer(X_train, spec)
+            fit_s = time.perf_counter() - t0
+            X_train, X_val = trainer.reduce_features(X_train), trainer.reduce_features(X_val_raw)
+        history = trainer.train_model(X_train, y_train, X_val, y_val, epochs=epochs, batch_size=batch_size,
+                                      use_tf_data=True, verbose=0)
+        h = history.history
+        latency = serving_latency(trainer, X_val_raw, repeat, batch_size)
+    return {
+        'spec': spec,
+        'features': int(X_train.shape[1]),
+        'params': int(trainer.model.count_params()),
+        'fit_s': fit_s,
+        'samples_per_sec': float(np.median(h['samples_per_sec'])),
+        'best_val_accuracy': float(max(h['val_accuracy'])),
+        'best_val_loss': float(min(h['val_loss'])),
+        'latency_ms': latency,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare feature-reduction specs')
+    parser.add_argument('--data-path', default='data')
+    parser.add_argument('--specs', nargs='+', default=['none', 'gray+pool2', 'gray+pool4', 'pool2+pca256', 'edges+pool4'])
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--repeat', type=int, default=50, help='iterations per latency measurement')
+    parser.add_argument('-o', '--output', help='write results as JSON')
+    args = parser.parse_args()
+
+    results = [evaluate_spec(spec, args.data_path, args.epochs, args.batch_size, args.repeat) for spec in args.specs]
+
+    print(f"\n{'spec':16s} {'features':>9s} {'params':>11s} {'fit s':>6s} {'train/s':>8s} "
+          f"{'val_acc':>8s} {'ms@1':>7s} {'ms@' + str(args.batch_size):>7s}")
+    for r in results:
+        lat = list(r['latency_ms'].values())
+        print(f"{r['spec']:16s} {r['features']:9d} {r['params']:11,d} {r['fit_s']:6.1f} {r['samples_per_sec']:8.0f} "
+              f"{r['best_val_accuracy']:8.4f} {lat[0]:7.2f} {lat[1]:7.2f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Fitted feature reduction between preprocessed pixels and the Dense model.
+
+The first Dense layer sees every pixel, so it holds most of the model's
+weights and FLOPs. A ``FeatureReducer`` shrinks each flattened, normalized
+image before it reaches the model. It applies these steps in order, each
+optional:
+
+    grayscale   weighted channel sum (luma, in the dataset's channel order)
+    edges       Sobel gradient magnitude (line features)
+    pool        k x k average pooling (downsample)
+    pca         IncrementalPCA projection, fitted in streaming batches
+
+Only NumPy is needed to apply it; scikit-learn is imported only to fit the
+PCA. The fitted state is saved next to the model (``features.json`` plus
+``features_pca.npz``) and the server applies the same reducer in front of
+every forward pass.
+"""
+import os
+import json
+
+import numpy as np
+
+CONFIG_FILE = 'features.json'
+PCA_FILE = 'features_pca.npz'
+METHODS = ('none', 'pca', 'edges')
+# ITU-R 601 luma weights in RGB order
+_LUMA_RGB = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _sobel_magnitude(x):
+    """Gradient magnitude of (N, H, W) images; borders replicate edge pixels"""
+    p = np.pad(x, ((0, 0), (1, 1), (1, 1)), mode='edge')
+    gx = (p[:, :-2, 2:] + 2 * p[:, 1:-1, 2:] + p[:, 2:, 2:]) - (p[:, :-2, :-2] + 2 * p[:, 1:-1, :-2] + p[:, 2:, :-2])
+    gy = (p[:, 2:, :-2] + 2 * p[:, 2:, 1:-1] + p[:, 2:, 2:]) - (p[:, :-2, :-2] + 2 * p[:, :-2, 1:-1] + p[:, :-2, 2:])
+    return np.sqrt(gx * gx + gy * gy, dtype=np.float32)
+
+
+class FeatureReducer:
+    """Flattened image rows -> reduced feature rows"""
+
+    def __init__(self, image_shape, method='none', grayscale=False, pool=1, n_components=256,
+                 color_mode='bgr'):
+        if method not in METHODS:
+            raise ValueError(f"method must be one of {METHODS}, got {method!r}")
+        self.image_shape = tuple(int(d) for d in image_shape)
+        self.method = method
+        # edge features are computed on intensity, so they imply grayscale
+        self.grayscale = grayscale or method == 'edges'
+        self.pool = int(pool)
+        self.n_components = int(n_components)
+        self.color_mode = color_mode
+        self.mean = None
+        self.components = None
+        self._bias = None
+
+    @property
+    def input_dim(self):
+        return int(np.prod(self.image_shape))
+
+    @property
+    def spatial_dim(self):
+        """Features after grayscale/edges/pool, before PCA"""
+        h, w, c = self._hwc()
+        channels = 1 if self.grayscale else c
+        return (h // self.pool) * (w // self.pool) * channels
+
+    @property
+    def output_dim(self):
+        return self.n_components if self.method == 'pca' else self.spatial_dim
+
+    @property
+    def fitted(self):
+        return self.method != 'pca' or self.components is not None
+
+    def _hwc(self):
+        shape = self.image_shape
+        return shape if len(shape) == 3 else (shape[0], shape[1], 1)
+
+    def _spatial(self, X):
+        """grayscale -> edges -> pool on a float32 batch, returned flattened"""
+        h, w, c = self._hwc()
+        x = X.reshape(-1, h, w, c)
+        if self.grayscale and c == 3:
+            weights = _LUMA_RGB[::-1] if self.color_mode == 'bgr' else _LUMA_RGB
+            x = (x @ weights)[..., None]
+        if self.method == 'edges':
+            x = _sobel_magnitude(x[..., 0])[..., None]
+        k = self.pool
+        if k > 1:
+            n, h, w, c = x.shape
+            x = x[:, :h - h % k, :w - w % k].reshape(n, h // k, k, w // k, k, c).mean(axis=(2, 4), dtype=np.float32)
+        return x.reshape(x.shape[0], -1)
+
+    def _as_float(self, X):
+        X = np.asarray(X)
+        if X.dtype == np.uint8:
+            # compact datasets store raw pixels; match the float [0, 1] serving input
+            return X.astype(np.float32) * np.float32(1.0 / 255.0)
+        return X.astype(np.float32, copy=False)
+
+    def fit(self, X, batch_size=1024):
+        """Fit on (rows x input_dim) features, possibly a memmap, streaming ``batch_size`` rows at a time"""
+        if self.method != 'pca':
+            return self
+        if len(X) < self.n_components:
+            raise ValueError(f"PCA with n_components={self.n_components} needs at least that many training rows, "
+                             f"got {len(X)}; use a smaller pcaN or a pooling-only spec")
+        from sklearn.decomposition import IncrementalPCA
+
+        batch_size = max(batch_size, self.n_components)
+        pca = IncrementalPCA(n_components=self.n_components)
+        for start in range(0, len(X), batch_size):
+            chunk = self._spatial(self._as_float(X[start:start + batch_size]))
+            if len(chunk) < self.n_components:
+                break  # partial_fit needs at least n_components rows; the tail is dropped
+            pca.partial_fit(chunk)
+        self.mean = pca.mean_.astype(np.float32)
+        self.components = pca.components_.T.astype(np.float32)
+        self._bias = None
+        return self
+
+    def transform(self, X):
+        """Reduce one batch; accepts uint8 pixels or normalized float32"""
+        if self.method == 'none' and not self.grayscale and self.pool == 1:
+            return self._as_float(X)
+        out = self._spatial(self._as_float(X))
+        if self.method == 'pca':
+            if self.components is None:
+                raise RuntimeError("FeatureReducer.fit() must run before transform() for PCA")
+            if self._bias is None:
+                self._bias = -(self.mean @ self.components)
+            out = out @ self.components
+            out += self._bias
+        return out
+
+    def transform_all(self, X, batch_size=1024):
+        """Reduce a whole (possibly memory-mapped) array in chunks"""
+        out = np.empty((len(X), self.output_dim), dtype=np.float32)
+        for start in range(0, len(X), batch_size):
+            out[start:start + batch_size] = self.transform(X[start:start + batch_size])
+        return out
+
+    def wrap(self, predict_fn):
+        """predict_fn over reduced features -> predict_fn over preprocessed pixels"""
+        return lambda X: predict_fn(self.transform(X))
+
+    @property
+    def config(self):
+        return {
+            'method': self.method,
+            'image_shape': list(self.image_shape),
+            'color_mode': self.color_mode,
+            'grayscale': self.grayscale,
+            'pool': self.pool,
+            'n_components': self.n_components,
+            'input_dim': self.input_dim,
+            'output_dim': self.output_dim,
+        }
+
+    def save(self, out_dir):
+        with open(os.path.join(out_dir, CONFIG_FILE), 'w', encoding='utf-8') as f:
+            json.dump(self.config, f, indent=4)
+        if self.method == 'pca':
+            np.savez(os.path.join(out_dir, PCA_FILE), mean=self.mean, components=self.components)
+
+    @classmethod
+    def from_spec(cls, spec, image_shape, color_mode='bgr'):
+        """Build from a '+'-joined spec such as 'gray+pool4', 'pool2+pca256', 'edges+pool4' or 'none'"""
+        method, grayscale, pool, n_components = 'none', False, 1, 256
+        for step in (s.strip().lower() for s in spec.split('+')):
+            if step in ('none', ''):
+                continue
+            if step in ('gray', 'grayscale'):
+                grayscale = True
+            elif step == 'edges':
+                method = 'edges'
+            elif step.startswith('pool'):
+                pool = int(step[4:] or 2)
+            elif step.startswith('pca'):
+                method, n_components = 'pca', int(step[3:] or 256)
+            else:
+                raise ValueError(f"unknown feature reduction step {step!r} in {spec!r}")
+        if method == 'pca' and 'edges' in spec.lower():
+            raise ValueError("edges and pca cannot be combined")
+        return cls(image_shape, method, grayscale, pool, n_components, color_mode)
+
+    @classmethod
+    def load(cls, model_dir):
+        """The reducer saved with a model, or None when it has none"""
+        path = os.path.join(model_dir, CONFIG_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            cfg = json.load(f)
+        reducer = cls(cfg['image_shape'], cfg['method'], cfg['grayscale'], cfg['pool'], cfg['n_components'],
+                      cfg.get('color_mode', 'bgr'))
+        if reducer.method == 'pca':
+            with np.load(os.path.join(model_dir, PCA_FILE)) as npz:
+                reducer.mean, reducer.components = npz['mean'], npz['components']
+        return reducer
+
+    def __repr__(self):
+        steps = (['grayscale'] if self.grayscale else []) + (['edges'] if self.method == 'edges' else []) \
+            + ([f'pool{self.pool}'] if self.pool > 1 else []) + ([f'pca{self.n_components}'] if self.method == 'pca' else [])
+        return f"FeatureReducer({'+'.join(steps) or 'identity'}: {self.input_dim} -> {self.output_dim})"
@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+import threading
+
+import numpy as np
+
+
+class PreprocessedImageCache:
+    """On-disk cache of preprocessed images keyed by content hash + parameters.
+
+    Entries live under ``<cache_dir>/objects/<xx>/<sha256>.<params>.npy``: the
+    source file's SHA-256 plus a digest of the preprocessing parameters, so
+    renaming a file is free and changing ``image_size``/color mode never
+    returns stale pixels. Entries for other parameters are kept (switching
+    back is a hit) until their source is gone or the size limit evicts them.
+    ``index.json`` remembers each source's size and mtime so unchanged files
+    are not re-hashed on every run.
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, cache_dir, params, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.max_bytes = max_bytes
+        self.params = dict(params)
+        self.params_digest = hashlib.sha256(
+            json.dumps(self.params, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._index = self._read_index()
+
+    def _read_index(self):
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _content_hash(self, path):
+        """SHA-256 of the file, reusing the indexed hash when size/mtime match"""
+        abs_path = os.path.abspath(path)
+        st = os.stat(abs_path)
+        with self._lock:
+            entry = self._index.get(abs_path)
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return entry['sha256']
+
+        h = hashlib.sha256()
+        with open(abs_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        digest = h.hexdigest()
+        with self._lock:
+            self._index[abs_path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+        return digest
+
+    def _key(self, content_hash):
+        return f"{content_hash}.{self.params_digest[:16]}"
+
+    def _object_path(self, key):
+        return os.path.join(self.objects_dir, key[:2], key + '.npy')
+
+    def get(self, path):
+        """Return the cached array for ``path`` or None"""
+        obj = self._object_path(self._key(self._content_hash(path)))
+        try:
+            arr = np.load(obj)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(obj)  # LRU bookkeeping for size-based eviction
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return arr
+
+    def put(self, path, arr):
+        obj = self._object_path(self._key(self._content_hash(path)))
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        tmp = f"{obj}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, arr)
+        os.replace(tmp, obj)
+
+    def get_or_compute(self, path, compute):
+        """Cached value for ``path``; otherwise ``compute(path)`` and store it"""
+        arr = self.get(path)
+        if arr is not None:
+            return arr
+        arr = compute(path)
+        if arr is not None:
+            self.put(path, arr)
+        return arr
+
+    def prune(self, live_paths=None):
+        """Evict entries whose source is gone, then trim to ``max_bytes`` (LRU)
+
+        Entries made with other parameters survive as long as their source
+        does; only the size limit removes them.
+
+        Returns the number of cache files removed.
+        """
+        removed = 0
+        with self._lock:
+            if live_paths is not None:
+                live = {os.path.abspath(p) for p in live_paths}
+                for path in list(self._index):
+                    if path not in live or not os.path.exists(path):
+                        del self._index[path]
+            live_hashes = {entry['sha256'] for entry in self._index.values()}
+
+        objects = []
+        for root, _, files in os.walk(self.objects_dir):
+            for name in files:
+                obj = os.path.join(root, name)
+                content_hash = name.split('.', 1)[0] if name.endswith('.npy') else None
+                if content_hash not in live_hashes:
+                    # Orphaned by a deleted source (under any parameters) or a crash
+                    os.remove(obj)
+                    removed += 1
+                    continue
+                st = os.stat(obj)
+                objects.append((st.st_mtime, st.st_size, obj))
+
+        if self.max_bytes is not None:
+            total = sum(size for _, size, _ in objects)
+            for _, size, obj in sorted(objects):
+                if total <= self.max_bytes:
+                    break
+                os.remove(obj)
+                total -= size
+                removed += 1
+        return removed
+
+    def save(self):
+        """Persist the hash index"""
+        path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp = path + '.tmp'
+        with self._lock:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f)
+        os.replace(tmp, path)
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"Cache: {self.hits} hits, {self.misses} misses ({rate:.0%} hit rate)"
@@ -0,0 +1,62 @@
+import os
+import time
+import numpy as np
+
+# thứ tự outputs trong train_multihead.py
+HEAD_NAMES = ["line_type", "length_cls", "slope_cls", "curv_cls", "breaks_cls"]
+
+
+def argmax_and_name(arr, names):
+    idx = int(np.argmax(arr)); return names[idx], float(arr[idx])
+
+def unpack_attributes(preds, attr_cfg, row=0):
+    """Map the five output heads of one row to attribute class names"""
+    return {name: argmax_and_name(preds[i][row], attr_cfg[name])[0] for i, name in enumerate(HEAD_NAMES)}
+
+def check_outputs(preds, attr_cfg):
+    """Fail unless ``preds`` has one head per HEAD_NAMES entry, each as wide as its class list"""
+    if not isinstance(preds, (list, tuple)) or len(preds) != len(HEAD_NAMES):
+        count = len(preds) if isinstance(preds, (list, tuple)) else 1
+        raise ValueError(f"model produces {count} output(s), expected the {len(HEAD_NAMES)} heads {HEAD_NAMES}")
+    for head, name in zip(preds, HEAD_NAMES):
+        classes = attr_cfg.get(name)
+        if not classes:
+            raise ValueError(f"attr_config.json has no class list for head {name!r}")
+        if np.shape(head)[-1] != len(classes):
+            raise ValueError(f"head {name!r} has {np.shape(head)[-1]} outputs but attr_config.json "
+                             f"lists {len(classes)} classes")
+
+def load_model(model_dir, batch_size=32, backend="auto", mmap=False, intra_op_threads=None):
+    """Return (predict_fn, backend_name, input_dim)
+
+    ``backend`` is "numpy", "keras" or "auto". Auto prefers the NumPy artifact
+    in ``model_dir/serving`` (no TensorFlow import) and falls back to Keras +
+    model.h5 only when it has not been exported.
+
+    ``mmap`` maps the NumPy weights read-only so worker processes share them;
+    Keras always loads a private copy. ``intra_op_threads`` caps TensorFlow's
+    op thread pools (the NumPy backend follows OMP/OPENBLAS_NUM_THREADS).
+    """
+    if backend not in ("auto", "numpy", "keras"):
+        raise ValueError(f"unknown backend {backend!r}")
+    serving_dir = os.path.join(model_dir, "serving")
+    has_artifact = os.path.exists(os.path.join(serving_dir, "manifest.json"))
+    if backend == "numpy" and not has_artifact:
+        raise FileNotFoundError(f"no NumPy serving artifact in {serving_dir}")
+    if backend != "keras" and has_artifact:
+        from scripts.numpy_backend import NumpyDenseModel
+        m = NumpyDenseModel.load(serving_dir, mmap=mmap)
+        return m.predict, "numpy", m.input_dim
+    import tensorflow as tf
+    from tensorflow import keras
+    if intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    m = keras.models.load_model(os.path.join(model_dir, "model.h5"), compile=False)
+    return (lambda X: m.predict(X, verbose=0, batch_size=batch_size)), "keras", int(m.input_shape[-1])
+
+def warm_up(predict_fn, input_dim, batch_size=1):
+    """Run a dummy batch so BLAS/graph setup happens before the first request; returns ms"""
+    t0 = time.perf_counter()
+    predict_fn(np.zeros((batch_size, input_dim), dtype=np.float32))
+    return (time.perf_counter() - t0) * 1000.0
@@ -0,0 +1,274 @@
+"""Minimal in-process metrics with Prometheus text exposition + a sampling profiler.
+
+No client library is needed: ``REGISTRY.render()`` produces the text format
+served at ``/metrics``. Metrics are per process; with several workers, scrape
+each one or aggregate at the collector.
+"""
+import os
+import sys
+import time
+import threading
+import contextlib
+from bisect import bisect_left
+from collections import Counter as _Tally
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# seconds; covers sub-ms cache hits up to multi-second 12 MP decodes
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _fmt(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Gauge set explicitly, or computed at scrape time by ``fn`` (returning a number
+    or, for labelled gauges, a dict of label-value tuples to numbers)"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), fn=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self.fn = fn
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        if self.fn is not None:
+            try:
+                value = self.fn()
+            except Exception:
+                return []
+            items = sorted(value.items()) if isinstance(value, dict) else [((), value)]
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}"
+                                for k, v in items if v is not None]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            if idx < len(self.buckets):
+                series[idx] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _fmt(bound))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(series[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class SamplingProfiler:
+    """Opt-in wall-clock sampler for the next N requests
+
+    ``arm(n)`` starts a background thread that samples the stacks of threads
+    currently inside ``track()`` every ``interval_s``, plus long-lived worker
+    threads registered with ``thread()`` (the micro-batcher, where the forward
+    pass actually runs) under their own label. After ``n`` tracked
+    requests finish, the samples are written in collapsed/folded format
+    (``frame;frame;frame count`` per line), which flamegraph.pl, speedscope and
+    inferno read directly.
+    """
+
+    def __init__(self, out_dir='profiles', interval_s=0.005):
+        self.out_dir = out_dir
+        self.interval_s = interval_s
+        self._lock = threading.Lock()
+        self._active = {}      # thread ident -> request label
+        self._workers = {}     # thread ident -> label, sampled whenever armed
+        self._remaining = 0
+        self._samples = _Tally()
+        self._thread = None
+        self.last_output = None
+
+    @property
+    def armed(self):
+        return self._remaining > 0
+
+    def arm(self, num_requests, interval_s=None):
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._remaining = num_requests
+            self._samples = _Tally()
+            if interval_s:
+                self.interval_s = interval_s
+            self._thread = threading.Thread(target=self._sample_loop, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        return True
+
+    @contextlib.contextmanager
+    def track(self, label='request'):
+        if not self.armed:
+            yield
+            return
+        ident = threading.get_ident()
+        with self._lock:
+            self._active[ident] = label
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active.pop(ident, None)
+                self._remaining -= 1
+
+    @contextlib.contextmanager
+    def thread(self, label):
+        """Sample the calling thread under ``label`` while armed (does not count as a request)"""
+        ident = threading.get_ident()
+        with self._lock:
+            self._workers[ident] = label
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._workers.pop(ident, None)
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.interval_s)
+            with self._lock:
+                if self._remaining <= 0 and not self._active:
+                    break
+                active = {**self._workers, **self._active}
+            frames = sys._current_frames()
+            for ident, label in active.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(label)
+                self._samples[';'.join(reversed(stack))] += 1
+        self._write()
+
+    def _write(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, time.strftime('profile-%Y%m%d-%H%M%S') + f'-{os.getpid()}.folded')
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self._samples.most_common():
+                f.write(f"{stack} {count}\n")
+        with self._lock:
+            self.last_output = path
+            self._thread = None
+
+    def status(self):
+        with self._lock:
+            return {'armed': self._remaining > 0, 'remaining_requests': max(self._remaining, 0),
+                    'interval_ms': self.interval_s * 1000.0, 'last_output': self.last_output}
@@ -0,0 +1,226 @@
+"""Hot-reloadable model for the web tier.
+
+``ModelManager`` holds the live ``ServingModel`` (weights, labels, attribute
+config and its own micro-batcher). A reload loads and warms the new version
+on a background thread while the old one keeps serving, swaps the reference
+under a lock, then closes the old batcher once the last request that
+started on it has finished. A request therefore always sees one consistent
+version from start to end, and nothing in flight is dropped.
+
+Reloads are triggered by ``reload()`` (admin endpoint) or by ``watch()``,
+which polls ``model/CURRENT`` (see model_registry.py).
+"""
+import os
+import json
+import time
+import threading
+import contextlib
+
+from scripts.batching import MicroBatcher
+from scripts.inference import load_model, warm_up, check_outputs
+from scripts.features import FeatureReducer
+from scripts.preprocessing import ImagePreprocessor
+from scripts.model_registry import current_version
+from scripts.rule_engine import default_engine
+
+
+def load_checked(model_dir, load_kwargs=None):
+    """Load a model version and run every check the server runs before serving it
+
+    Raises ValueError (RuleError for the rules) when the server would refuse
+    the version; train.py runs this before publishing.
+    """
+    predict_fn, backend, input_dim = load_model(model_dir, **(load_kwargs or {}))
+    # a fitted feature reduction saved with the model runs inside the batched forward pass
+    reducer = FeatureReducer.load(model_dir)
+    if reducer is not None:
+        if reducer.output_dim != input_dim:
+            raise ValueError(f"{reducer} does not produce the model's {input_dim} inputs")
+        predict_fn, input_dim = reducer.wrap(predict_fn), reducer.input_dim
+    with open(os.path.join(model_dir, "labels.txt"), "r", encoding="utf-8") as f:
+        labels = [l.strip() for l in f.read().splitlines() if l.strip()]
+    with open(os.path.join(model_dir, "attr_config.json"), "r", encoding="utf-8") as f:
+        attr_cfg = json.load(f)
+    # uploads are decoded exactly as the training set was; refuse a model they cannot feed
+    preprocessor = ImagePreprocessor.for_model(attr_cfg)
+    if reducer is not None and list(reducer.image_shape) != preprocessor.image_shape:
+        raise ValueError(f"{reducer} expects images of shape {list(reducer.image_shape)}, "
+                         f"{preprocessor} produces {preprocessor.image_shape}")
+    # ... and must produce the five heads attr_config.json names
+    check_outputs(predict_fn(preprocessor.self_check(input_dim)), attr_cfg)
+    # every class the model can predict needs interpretation rules (compiles them on first load)
+    default_engine().check_values(attr_cfg, labels)
+    return predict_fn, backend, input_dim, labels, attr_cfg, reducer, preprocessor
+
+
+class ServingModel:
+    """One loaded model version and the batcher that feeds it"""
+
+    def __init__(self, version, model_dir, predict_fn, backend, input_dim, labels, attr_cfg, batcher):
+        self.version = version
+        self.model_dir = model_dir
+        self.predict_fn = predict_fn
+        self.backend = backend
+        self.input_dim = input_dim
+        self.labels = labels
+        self.attr_cfg = attr_cfg
+        self.batcher = batcher
+        self.loaded_at = time.time()
+        self.warmup_ms = None
+        self.reducer = None
+        self.preprocessor = None
+        self._inflight = 0
+        self._retired = False
+
+    @classmethod
+    def load(cls, version, model_dir, load_kwargs=None, batcher_kwargs=None):
+        predict_fn, backend, input_dim, labels, attr_cfg, reducer, preprocessor = \
+            load_checked(model_dir, load_kwargs)
+        # warm up before the batcher exists so the first real batch is not the slow one
+        warmup_ms = warm_up(predict_fn, input_dim)
+        model = cls(version, model_dir, predict_fn, backend, input_dim, labels, attr_cfg,
+                    MicroBatcher(predict_fn, **(batcher_kwargs or {})))
+        model.warmup_ms = warmup_ms
+        model.reducer = reducer
+        model.preprocessor = preprocessor
+        return model
+
+    def describe(self):
+        return {"version": self.version, "backend": self.backend, "model_dir": self.model_dir,
+                "loaded_at": self.loaded_at, "warmup_ms": self.warmup_ms,
+                "preprocessing": repr(self.preprocessor),
+                "feature_reduction": repr(self.reducer) if self.reducer is not None else None}
+
+
+class ModelManager:
+    def __init__(self, root, load_kwargs=None, batcher_kwargs=None, on_reload=None):
+        self.root = root
+        self.load_kwargs = load_kwargs or {}
+        self.batcher_kwargs = batcher_kwargs or {}
+        # optional hook(result, version, seconds); result is "swapped", "unchanged" or "failed"
+        self.on_reload = on_reload
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        self._stop = threading.Event()
+        self._watcher = None
+        self.last_reload = None
+        self.draining = 0
+        version, model_dir = current_version(root)
+        self._current = ServingModel.load(version, model_dir, self.load_kwargs, self.batcher_kwargs)
+
+    @property
+    def current(self):
+        return self._current
+
+    @contextlib.contextmanager
+    def use(self):
+        """Pin the live model for the duration of one request"""
+        with self._lock:
+            model = self._current
+            model._inflight += 1
+        try:
+            yield model
+        finally:
+            with self._lock:
+                model._inflight -= 1
+                close_now = model._retired and model._inflight == 0
+            if close_now:
+                self._close_retired(model)
+
+    def reload(self, block=False):
+        """Load CURRENT in the background and swap it in; False if a reload is already running"""
+        with self._lock:
+            if self._reloading:
+                return False
+            self._reloading = True
+        if block:
+            self._reload()
+        else:
+            threading.Thread(target=self._reload, name="model-reload", daemon=True).start()
+        return True
+
+    def _reload(self):
+        t0 = time.perf_counter()
+        version = None
+        try:
+            with self._reload_lock:
+                version, model_dir = current_version(self.root)
+                if version == self._current.version:
+                    result = "unchanged"
+                else:
+                    new = ServingModel.load(version, model_dir, self.load_kwargs, self.batcher_kwargs)
+                    self._swap(new)
+                    result = "swapped"
+            error = None
+        except Exception as e:
+            # keep serving the old version; the failure shows up in status() and metrics
+            result, error = "failed", f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - t0
+        with self._lock:
+            self._reloading = False
+            self.last_reload = {"result": result, "version": version, "error": error,
+                                "seconds": seconds, "at": time.time()}
+        if result != "unchanged":
+            print(f"[model] reload {result}: {version} in {seconds:.2f}s" + (f" ({error})" if error else ""))
+        if self.on_reload is not None:
+            self.on_reload(result, version, seconds)
+        return result
+
+    def _swap(self, new):
+        with self._lock:
+            old, self._current = self._current, new
+            old._retired = True
+            close_now = old._inflight == 0
+            self.draining += 1
+        if close_now:
+            self._close_retired(old)
+
+    def _close_retired(self, model):
+        # drain on another thread: the caller may be a request thread
+        def close():
+            model.batcher.close(drain=True)
+            with self._lock:
+                self.draining -= 1
+        threading.Thread(target=close, name=f"drain-{model.version}", daemon=True).start()
+
+    def watch(self, interval_s):
+        """Poll CURRENT every ``interval_s`` and reload when it changes
+
+        A version that fails to load is not retried by the watcher until
+        CURRENT points somewhere else; ``reload()`` (the admin endpoint)
+        still retries it.
+        """
+        if interval_s <= 0 or self._watcher is not None:
+            return
+
+        def loop():
+            pending = failed = None
+            while not self._stop.wait(interval_s):
+                try:
+                    version, _ = current_version(self.root)
+                except OSError:
+                    continue
+                if version == self._current.version or version == failed:
+                    pending = None
+                elif version == pending:
+                    # unchanged over two polls: a legacy flat directory is not mid-write
+                    self.reload(block=True)
+                    last = self.last_reload or {}
+                    if last.get("result") == "failed" and last.get("version") == version:
+                        failed = version
+                    pending = None
+                else:
+                    pending = version
+
+        self._watcher = threading.Thread(target=loop, name="model-watch", daemon=True)
+        self._watcher.start()
+
+    def status(self):
+        with self._lock:
+            return {**self._current.describe(), "reloading": self._reloading, "draining": self.draining,
+                    "last_reload": self.last_reload}
+
+    def close(self):
+        self._stop.set()
+        self._current.batcher.close(drain=True)
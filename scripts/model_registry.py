@@ -0,0 +1,133 @@
+"""Versioned model directory layout shared by training and serving.
+
+    model/
+        CURRENT                     name of the live version, replaced atomically
+        versions/
+            20261017-101500/        model.h5, serving/, labels.txt, attr_config.json
+            20261018-093000/
+
+``scripts/train.py`` writes each run into a hidden staging directory,
+renames it into ``versions/`` once every file is complete and then points
+``CURRENT`` at it. A version directory is never modified afterwards, so a
+server can load it while training keeps going.
+
+A model root without ``CURRENT`` is the legacy flat layout (files directly
+in ``model/``); it is served as a single version named after a fingerprint
+of its files.
+"""
+import os
+import time
+import shutil
+import hashlib
+
+CURRENT_FILE = 'CURRENT'
+VERSIONS_DIR = 'versions'
+# files whose size/mtime identify a legacy flat model directory
+_FINGERPRINT_FILES = ('model.h5', os.path.join('serving', 'manifest.json'), 'attr_config.json')
+
+
+def fingerprint(model_dir):
+    """Short fingerprint of the model files (changes whenever they are rewritten)"""
+    h = hashlib.sha256()
+    for name in _FINGERPRINT_FILES:
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            h.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode('utf-8'))
+    return h.hexdigest()[:12]
+
+
+def version_dir(root, version):
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def new_version_id(root):
+    """Timestamped id that sorts chronologically and is unused under ``root``"""
+    base = time.strftime('%Y%m%d-%H%M%S')
+    version, n = base, 1
+    while os.path.exists(version_dir(root, version)):
+        n += 1
+        version = f"{base}-{n}"
+    return version
+
+
+def begin_version(root, version):
+    """Create and return an empty staging directory for ``version``"""
+    staging = os.path.join(root, VERSIONS_DIR, f".{version}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    return staging
+
+
+def commit_version(root, version, staging):
+    """Move a fully written staging directory into place; returns its final path"""
+    path = version_dir(root, version)
+    os.replace(staging, path)
+    return path
+
+
+def publish(root, version):
+    """Make ``version`` the one servers load (atomic rename of CURRENT)"""
+    if not os.path.isdir(version_dir(root, version)):
+        raise FileNotFoundError(f"no model version {version!r} in {root}")
+    tmp = os.path.join(root, f".{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(root, CURRENT_FILE))
+
+
+def current_version(root):
+    """(version, directory) of the model servers should be running"""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return fingerprint(root), root
+    return version, version_dir(root, version)
+
+
+def list_versions(root):
+    """Committed versions, oldest first"""
+    path = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path)
+                  if not name.startswith('.') and os.path.isdir(os.path.join(path, name)))
+
+
+def prune_versions(root, keep=5):
+    """Delete all but the newest ``keep`` versions (never the current one)"""
+    current, _ = current_version(root)
+    removed = []
+    for version in list_versions(root)[:-keep or None]:
+        if version != current:
+            shutil.rmtree(version_dir(root, version))
+            removed.append(version)
+    return removed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='List, publish (roll back) or prune model versions')
+    parser.add_argument('--root', default='model')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list')
+    p = sub.add_parser('publish', help='point CURRENT at an existing version')
+    p.add_argument('version')
+    p = sub.add_parser('prune')
+    p.add_argument('--keep', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        current, _ = current_version(args.root)
+        for version in list_versions(args.root):
+            print(('* ' if version == current else '  ') + version)
+    elif args.command == 'publish':
+        publish(args.root, args.version)
+        print(f"CURRENT -> {args.version}")
+    else:
+        for version in prune_versions(args.root, args.keep):
+            print(f"removed {version}")
@@ -0,0 +1,256 @@
+"""Pure-NumPy inference for Dense-only Keras models.
+
+The serving artifact is a directory with ``manifest.json`` plus one
+uncompressed ``.npy`` file per kernel/bias, written once by
+``export_dense_model`` (called from ``save_model_artifacts``). Loading it
+needs only NumPy, so the web tier starts without importing TensorFlow.
+
+Kernels can be stored as float32, float16 or int8 (symmetric, one scale
+per output unit). Quantized kernels stay quantized in memory and are
+upcast block by block during the matmul, so an int8 artifact needs about
+a quarter of the float32 RAM. Pass ``dequantize=True`` to ``load`` to
+trade that saving back for float32 matmul speed.
+
+Pass ``mmap=True`` to map the ``.npy`` files read-only instead of reading
+them into the heap. Every process that maps the same artifact shares one
+copy of the weights through the OS page cache, so N pre-forked workers
+do not need N copies (see gunicorn.conf.py).
+
+Convert an existing model and check it against Keras:
+    python scripts/numpy_backend.py model/model.h5 model/serving --quantize int8
+"""
+import os
+import json
+
+import numpy as np
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 2
+WEIGHT_DTYPES = ('float32', 'float16', 'int8')
+# Rows of a quantized kernel upcast to float32 at a time
+MATMUL_BLOCK_ROWS = 8192
+
+# Layers that are the identity at inference time
+_PASSTHROUGH = ('InputLayer', 'Dropout', 'Flatten', 'ActivityRegularization',
+                'GaussianNoise', 'GaussianDropout', 'AlphaDropout')
+
+
+def _relu(x):
+    return np.maximum(x, 0, out=x)
+
+def _softmax(x):
+    x -= x.max(axis=-1, keepdims=True)
+    np.exp(x, out=x)
+    x /= x.sum(axis=-1, keepdims=True)
+    return x
+
+def _sigmoid(x):
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1.0
+    return np.reciprocal(x, out=x)
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': _relu,
+    'softmax': _softmax,
+    'sigmoid': _sigmoid,
+    'tanh': lambda x: np.tanh(x, out=x),
+}
+
+
+def _inbound_layer(layer):
+    inbound = layer._inbound_nodes[0].inbound_layers
+    if isinstance(inbound, (list, tuple)):
+        if len(inbound) != 1:
+            raise ValueError(f"layer {layer.name!r} has {len(inbound)} inputs; only chains/trees of Dense are supported")
+        inbound = inbound[0]
+    return inbound
+
+
+def quantize_kernel(kernel, weight_dtype):
+    """Return (stored_kernel, per-unit scale or None)"""
+    if weight_dtype == 'float32':
+        return kernel.astype(np.float32), None
+    if weight_dtype == 'float16':
+        return kernel.astype(np.float16), None
+    if weight_dtype == 'int8':
+        scale = np.abs(kernel).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        q = np.clip(np.rint(kernel / scale), -127, 127).astype(np.int8)
+        return q, scale.astype(np.float32)
+    raise ValueError(f"weight_dtype must be one of {WEIGHT_DTYPES}, got {weight_dtype!r}")
+
+
+def export_dense_model(model, out_dir, weight_dtype='float32'):
+    """Write the Dense layers of ``model`` as a NumPy serving artifact"""
+    if weight_dtype not in WEIGHT_DTYPES:
+        raise ValueError(f"weight_dtype must be one of {WEIGHT_DTYPES}, got {weight_dtype!r}")
+    os.makedirs(out_dir, exist_ok=True)
+    alias = {}   # layer name -> name of the tensor it produces
+    layers = []
+
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == 'InputLayer':
+            alias[layer.name] = 'input'
+            continue
+        src = _inbound_layer(layer)
+        src = alias.get(src.name, 'input' if type(src).__name__ == 'InputLayer' else src.name)
+        if kind in _PASSTHROUGH:
+            alias[layer.name] = src
+            continue
+        if kind != 'Dense':
+            raise ValueError(f"unsupported layer {layer.name!r} ({kind}); NumPy backend only runs Dense stacks")
+
+        activation = layer.get_config()['activation']
+        if activation not in ACTIVATIONS:
+            raise ValueError(f"unsupported activation {activation!r} in layer {layer.name!r}")
+        params = layer.get_weights()
+        kernel = params[0]
+        bias = params[1] if layer.use_bias else None
+        stored, scale = quantize_kernel(kernel, weight_dtype)
+        np.save(os.path.join(out_dir, f"{layer.name}.kernel.npy"), stored)
+        if scale is not None:
+            np.save(os.path.join(out_dir, f"{layer.name}.scale.npy"), scale)
+        if bias is not None:
+            np.save(os.path.join(out_dir, f"{layer.name}.bias.npy"), bias.astype(np.float32))
+        layers.append({
+            'name': layer.name,
+            'input': src,
+            'activation': activation,
+            'units': int(kernel.shape[1]),
+            'use_bias': bias is not None,
+            'weight_dtype': weight_dtype,
+        })
+        alias[layer.name] = layer.name
+
+    outputs = [alias[name] for name in model.output_names]
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'weight_dtype': weight_dtype,
+        'input_dim': int(model.input_shape[-1]),
+        'layers': layers,
+        'outputs': outputs,
+    }
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+def _matmul(x, kernel, scale, block_rows=MATMUL_BLOCK_ROWS):
+    """x @ kernel for float32 or quantized kernels (upcast in row blocks)"""
+    if kernel.dtype == np.float32:
+        return x @ kernel
+    out = np.zeros((x.shape[0], kernel.shape[1]), dtype=np.float32)
+    for start in range(0, kernel.shape[0], block_rows):
+        stop = start + block_rows
+        out += x[:, start:stop] @ kernel[start:stop].astype(np.float32)
+    if scale is not None:
+        out *= scale
+    return out
+
+
+class NumpyDenseModel:
+    """Forward pass of an exported Dense stack with plain (BLAS) matmuls"""
+
+    def __init__(self, manifest, weights):
+        self.manifest = manifest
+        self.input_dim = manifest['input_dim']
+        self.layers = manifest['layers']
+        self.outputs = manifest['outputs']
+        self.weights = weights
+
+    @classmethod
+    def load(cls, model_dir, dequantize=False, mmap=False):
+        """Load an artifact
+
+        ``dequantize`` expands float16/int8 kernels to float32 (private heap
+        copy); ``mmap`` maps kernels read-only so processes share them.
+        """
+        with open(os.path.join(model_dir, MANIFEST), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        weights = {}
+        for layer in manifest['layers']:
+            prefix = os.path.join(model_dir, layer['name'])
+            kernel = np.load(prefix + '.kernel.npy', mmap_mode='r' if mmap else None)
+            scale = np.load(prefix + '.scale.npy') if os.path.exists(prefix + '.scale.npy') else None
+            bias = np.load(prefix + '.bias.npy') if layer['use_bias'] else None
+            if dequantize and kernel.dtype != np.float32:
+                # np.array, not astype: a memmap's astype is still an np.memmap
+                kernel = np.array(kernel, dtype=np.float32)
+                if scale is not None:
+                    kernel *= scale
+                    scale = None
+            weights[layer['name']] = (kernel, scale, bias)
+        return cls(manifest, weights)
+
+    def nbytes(self):
+        """Bytes held by kernels, scales and biases"""
+        return sum(a.nbytes for ws in self.weights.values() for a in ws if a is not None)
+
+    def mapped_nbytes(self):
+        """Bytes of kernels backed by a shared file mapping rather than the heap"""
+        return sum(ws[0].nbytes for ws in self.weights.values() if isinstance(ws[0], np.memmap))
+
+    def predict(self, X):
+        """Return a list with one (rows x units) array per model output"""
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        if X.shape[1] != self.input_dim:
+            raise ValueError(f"expected {self.input_dim} features, got {X.shape[1]}")
+
+        tensors = {'input': X}
+        for layer in self.layers:
+            kernel, scale, bias = self.weights[layer['name']]
+            h = _matmul(tensors[layer['input']], kernel, scale)
+            if bias is not None:
+                h += bias
+            tensors[layer['name']] = ACTIVATIONS[layer['activation']](h)
+        return [tensors[name] for name in self.outputs]
+
+    def __call__(self, X):
+        return self.predict(X)
+
+
+def check_parity(keras_model, numpy_model, num_rows=8, atol=1e-4, seed=0):
+    """Compare Keras and NumPy outputs on random inputs
+
+    Returns (max_abs_diff, argmax_agreement). Raises AssertionError when the
+    difference exceeds ``atol``; pass ``atol=None`` to only measure.
+    """
+    rng = np.random.default_rng(seed)
+    X = rng.random((num_rows, numpy_model.input_dim), dtype=np.float32)
+    expected = keras_model.predict(X, verbose=0)
+    if not isinstance(expected, (list, tuple)):
+        expected = [expected]
+    actual = numpy_model.predict(X)
+    if len(expected) != len(actual):
+        raise AssertionError(f"Keras has {len(expected)} outputs, NumPy backend has {len(actual)}")
+
+    max_diff = max(float(np.abs(e - a).max()) for e, a in zip(expected, actual))
+    agreement = float(np.mean([np.mean(e.argmax(-1) == a.argmax(-1)) for e, a in zip(expected, actual)]))
+    if atol is not None and max_diff > atol:
+        raise AssertionError(f"NumPy backend differs from Keras by {max_diff:.3g} (atol={atol})")
+    return max_diff, agreement
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Export a Dense-only Keras model for NumPy serving')
+    parser.add_argument('model', help='path to model.h5')
+    parser.add_argument('out_dir', help='serving artifact directory (e.g. model/serving)')
+    parser.add_argument('--quantize', choices=WEIGHT_DTYPES, default='float32',
+                        help='kernel storage dtype')
+    args = parser.parse_args()
+
+    from tensorflow import keras
+    keras_model = keras.models.load_model(args.model, compile=False)
+    manifest = export_dense_model(keras_model, args.out_dir, args.quantize)
+    numpy_model = NumpyDenseModel.load(args.out_dir)
+    max_diff, agreement = check_parity(keras_model, numpy_model, atol=None)
+    print(f"Exported {len(manifest['layers'])} Dense layers ({args.quantize}, "
+          f"{numpy_model.nbytes() / 2**20:.1f} MiB) to {args.out_dir}")
+    print(f"Parity vs Keras: max |diff| = {max_diff:.3g}, argmax agreement = {agreement:.1%}")
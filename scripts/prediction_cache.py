@@ -0,0 +1,268 @@
+"""Cache of raw model head outputs keyed by upload hash + model version.
+
+Only the model outputs are cached, never the interpretation, so a user who
+re-uploads the same photo with a different ``line_type`` skips decode,
+preprocess and the forward pass and only re-runs the rule step.
+
+Two backends:
+  * ``MemoryPredictionCache``: per-process LRU with TTL and a byte bound.
+  * ``SqlitePredictionCache``: a SQLite file shared by every worker process
+    on the box (e.g. several gunicorn workers), same LRU/TTL/byte bound.
+"""
+import os
+import sys
+import json
+import math
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Per-entry bookkeeping on top of the key and the encoded heads: OrderedDict
+# node, the (expires_at, blob, size) tuple and its float (~180 B measured
+# with tracemalloc on CPython 3.11), rounded up
+_ENTRY_OVERHEAD = 200
+# SQLite eviction frees down to this fraction of max_bytes, so the delete
+# runs once per few thousand puts instead of on every put
+_LOW_WATER = 0.95
+
+
+def cache_key(data, model_version):
+    """Key for an uploaded file's bytes under a given model version"""
+    h = hashlib.sha256(data)
+    h.update(b'\0' + str(model_version).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _encode(heads):
+    arrays = [np.ascontiguousarray(h, dtype=np.float32) for h in heads]
+    header = json.dumps([list(a.shape) for a in arrays]).encode('utf-8')
+    return len(header).to_bytes(4, 'little') + header + b''.join(a.tobytes() for a in arrays)
+
+
+def _decode(blob):
+    n = int.from_bytes(blob[:4], 'little')
+    shapes = json.loads(blob[4:4 + n].decode('utf-8'))
+    heads, offset = [], 4 + n
+    for shape in shapes:
+        size = int(np.prod(shape)) * 4
+        heads.append(np.frombuffer(blob, dtype=np.float32, count=size // 4, offset=offset).reshape(shape))
+        offset += size
+    return heads
+
+
+class _Stats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0}
+
+
+class MemoryPredictionCache:
+    """In-process LRU + TTL cache bounded by the memory its entries actually use
+
+    Heads are stored as one encoded bytes object per entry (a handful of
+    small ndarrays would cost ~1 KB of object overhead for 56 B of floats).
+    Each entry is charged for its key, its blob and ``_ENTRY_OVERHEAD``.
+    """
+
+    backend = 'memory'
+
+    def __init__(self, max_bytes=64 * 2**20, ttl_s=3600.0):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()  # key -> (expires_at, blob, charged bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = _Stats()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    self._drop(key)
+                self._stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats.hits += 1
+            blob = entry[1]
+        return _decode(blob)
+
+    def put(self, key, heads):
+        blob = _encode(heads)
+        nbytes = sys.getsizeof(key) + sys.getsizeof(blob) + _ENTRY_OVERHEAD
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_s, blob, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats.evictions += 1
+
+    def _drop(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            s = self._stats.as_dict()
+            s.update(backend=self.backend, entries=len(self._entries), bytes=self._bytes,
+                     max_bytes=self.max_bytes, ttl_s=self.ttl_s)
+        return s
+
+
+class SqlitePredictionCache:
+    """Process-shared LRU + TTL cache stored in a SQLite file
+
+    The total size and entry count are kept in a ``cache_meta`` row updated in
+    the same transaction as every write, so a put never scans the table;
+    when the total goes over ``max_bytes`` the least recently used rows are
+    deleted in one statement, down to ``_LOW_WATER`` of the bound.
+    Hit/miss counters are per process; ``entries``/``bytes`` are global.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path, max_bytes=256 * 2**20, ttl_s=3600.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = _Stats()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._conn()
+        conn.execute("""CREATE TABLE IF NOT EXISTS predictions (
+                            key TEXT PRIMARY KEY,
+                            expires_at REAL NOT NULL,
+                            accessed_at REAL NOT NULL,
+                            nbytes INTEGER NOT NULL,
+                            value BLOB NOT NULL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions(accessed_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS predictions_expires ON predictions(expires_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (id INTEGER PRIMARY KEY CHECK (id = 0), "
+                     "entries INTEGER NOT NULL, bytes INTEGER NOT NULL)")
+        # one full scan, only when the file predates the running totals
+        conn.execute("INSERT OR IGNORE INTO cache_meta SELECT 0, COUNT(*), COALESCE(SUM(nbytes), 0) "
+                     "FROM predictions")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self._stats, field, getattr(self._stats, field) + 1)
+
+    def get(self, key):
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT expires_at, value FROM predictions WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] < now:
+                self._count('misses')
+                return None
+            conn.execute("UPDATE predictions SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error:
+            # A busy/locked cache must never fail the request
+            self._count('misses')
+            return None
+        self._count('hits')
+        return _decode(row[1])
+
+    def put(self, key, heads):
+        blob = _encode(heads)
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                entries, total = conn.execute("SELECT entries, bytes FROM cache_meta").fetchone()
+                old = conn.execute("SELECT nbytes FROM predictions WHERE key = ?", (key,)).fetchone()
+                conn.execute("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?)",
+                             (key, now + self.ttl_s, now, len(blob), blob))
+                entries, total = entries + (old is None), total + len(blob) - (old[0] if old else 0)
+                n, freed = conn.execute("SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM predictions "
+                                        "WHERE expires_at < ?", (now,)).fetchone()
+                if n:
+                    conn.execute("DELETE FROM predictions WHERE expires_at < ?", (now,))
+                    entries, total = entries - n, total - freed
+                evicted = 0
+                while total > self.max_bytes and entries > 0:
+                    # rows are about the same size: size the batch from this one
+                    excess = total - int(self.max_bytes * _LOW_WATER)
+                    n, freed = self._evict_lru(conn, max(1, math.ceil(excess / len(blob))))
+                    entries, total, evicted = entries - n, total - freed, evicted + n
+                conn.execute("UPDATE cache_meta SET entries = ?, bytes = ?", (entries, total))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            return
+        with self._lock:
+            self._stats.evictions += evicted
+
+    @staticmethod
+    def _evict_lru(conn, limit):
+        """Delete the ``limit`` least recently used rows; returns (rows, bytes) freed"""
+        lru = "SELECT key FROM predictions ORDER BY accessed_at LIMIT ?"
+        n, freed = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM predictions "
+                                f"WHERE key IN ({lru})", (limit,)).fetchone()
+        conn.execute(f"DELETE FROM predictions WHERE key IN ({lru})", (limit,))
+        return n, freed
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM predictions")
+        conn.execute("UPDATE cache_meta SET entries = 0, bytes = 0")
+        conn.execute("COMMIT")
+
+    def stats(self):
+        with self._lock:
+            s = self._stats.as_dict()
+        try:
+            entries, nbytes = self._conn().execute("SELECT entries, bytes FROM cache_meta").fetchone()
+        except sqlite3.Error:
+            entries, nbytes = None, None
+        s.update(backend=self.backend, path=self.path, entries=entries, bytes=nbytes,
+                 max_bytes=self.max_bytes, ttl_s=self.ttl_s)
+        return s
+
+
+def make_prediction_cache(backend, max_bytes, ttl_s, path=None):
+    """Build a cache from config; backend is 'memory', 'sqlite' or 'none'"""
+    if backend == 'none':
+        return None
+    if backend == 'memory':
+        return MemoryPredictionCache(max_bytes, ttl_s)
+    if backend == 'sqlite':
+        return SqlitePredictionCache(path, max_bytes, ttl_s)
+    raise ValueError(f"unknown prediction cache backend {backend!r}")
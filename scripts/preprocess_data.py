@@ -1,16 +1,38 @@
 import os
-import cv2
+import sys
+import time
 import numpy as np
+import PIL
+from PIL import Image
 import json
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import LabelEncoder
 import pickle
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.image_cache import PreprocessedImageCache
+from scripts.preprocessing import ImagePreprocessor, normalize, open_image
 
 class PalmistryDataPreprocessor:
-    def __init__(self, raw_data_path, output_path):
+    def __init__(self, raw_data_path, output_path, num_workers=None,
+                 cache_dir=None, cache_max_bytes=None, compact=False, preprocessing=None):
         self.raw_data_path = raw_data_path
         self.output_path = output_path
-        self.image_size = (224, 224)  # Resize images to consistent size
+        # Same decode/resize/channel order as the server (scripts/preprocessing.py);
+        # ``preprocessing`` overrides the 224x224 BGR defaults
+        self.preprocessor = ImagePreprocessor.from_config(preprocessing)
+        self.image_size = self.preprocessor.image_size
+        self.color_mode = self.preprocessor.color_mode
+        # compact: store raw uint8 pixels (4x smaller); the trainer normalizes per batch
+        self.normalization = 'none' if compact else 'divide_by_255'
+        # Decode/resize worker threads (PIL releases the GIL while decoding); 1 = serial
+        self.num_workers = num_workers or os.cpu_count() or 1
+        
+        # Content-addressed cache of decoded images (None disables it)
+        self.cache = None
+        if cache_dir:
+            self.cache = PreprocessedImageCache(cache_dir, self._cache_params(), cache_max_bytes)
         self.label_encoder = LabelEncoder()
         
         # Palm reading attributes mapping
@@ -47,10 +69,124 @@ class PalmistryDataPreprocessor:
         json_files = [f for f in os.listdir(self.raw_data_path) if f.endswith('.json')]
         return len(json_files) > 0
     
-    def _load_yolo_format(self):
-        """Load data from YOLO format"""
+    def _list_samples(self):
+        """List (image_path, label) pairs without decoding any image"""
+        if self._is_yolo_format():
+            return self._list_yolo_samples()
+        elif self._is_coco_format():
+            return self._list_coco_samples()
+        else:
+            return self._list_folder_samples()
+    
+    def _cache_params(self):
+        """Everything that changes the decoded pixels goes into the cache key"""
+        return dict(self.preprocessor.config, decoder=f"pil-{PIL.__version__}")
+    
+    def _load_image(self, img_path):
+        """Load one image (through the cache when enabled) in the storage dtype"""
+        if self.cache is None:
+            pixels = self._decode_image(img_path)
+        else:
+            pixels = self.cache.get_or_compute(img_path, self._decode_image)
+        # the cache holds uint8 pixels for both formats (4x smaller than float32)
+        if pixels is None or self.normalization == 'none':
+            return pixels
+        return normalize(pixels)
+    
+    def _decode_image(self, img_path):
+        """Decode and resize one image to uint8 pixels; returns None if unreadable"""
+        try:
+            return self.preprocessor.pixels(img_path)
+        except (OSError, ValueError):
+            return None
+    
+    @property
+    def storage_dtype(self):
+        return np.uint8 if self.normalization == 'none' else np.float32
+    
+    def _decode_images(self, paths, executor=None):
+        """Decode paths in input order, using the thread pool when given"""
+        if executor is None:
+            return [self._load_image(path) for path in paths]
+        return list(executor.map(self._load_image, paths))
+    
+    def _make_executor(self):
+        if self.num_workers <= 1:
+            return None
+        return ThreadPoolExecutor(max_workers=self.num_workers, thread_name_prefix='decode')
+    
+    def _report_throughput(self, count, elapsed):
+        rate = count / elapsed if elapsed > 0 else float('inf')
+        print(f"Loaded {count} images in {elapsed:.2f}s "
+              f"({rate:.1f} images/sec, {self.num_workers} workers)")
+    
+    def _finish_cache(self, samples):
+        """Evict stale cache entries and persist the hash index"""
+        if self.cache is None:
+            return
+        removed = self.cache.prune([path for path, _ in samples])
+        self.cache.save()
+        print(f"{self.cache.summary()}, {removed} stale entries evicted")
+    
+    def _header_ok(self, img_path):
+        """Cheap readability check (header + structure, no pixel decode)"""
+        try:
+            with open_image(img_path, self.preprocessor.max_pixels) as img:
+                img.verify()
+            return True
+        except (OSError, ValueError, SyntaxError, Image.DecompressionBombError):
+            return False
+    
+    def _readable_samples(self, samples):
+        """Drop images whose header won't open, before labels are encoded and split
+        
+        Both the eager and the streaming path filter here, so they see the same
+        samples and make the same split.
+        """
+        executor = self._make_executor()
+        try:
+            paths = [path for path, _ in samples]
+            ok = list(executor.map(self._header_ok, paths)) if executor else [self._header_ok(p) for p in paths]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        dropped = [path for path, good in zip(paths, ok) if not good]
+        if dropped:
+            print(f"Warning: skipping {len(dropped)} unreadable images:")
+            for path in dropped[:10]:
+                print(f"  {path}")
+        return [sample for sample, good in zip(samples, ok) if good]
+    
+    def _undecodable(self, paths):
+        return RuntimeError(f"{len(paths)} images passed the header check but could not be decoded "
+                            f"(first: {paths[0]}); fix or remove them and re-run")
+    
+    def _load_samples(self, samples):
+        """Decode a list of readable samples"""
+        samples = self._readable_samples(samples)
         images = []
         labels = []
+        start = time.perf_counter()
+        executor = self._make_executor()
+        try:
+            decoded = self._decode_images([path for path, _ in samples], executor)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self._report_throughput(len(samples), time.perf_counter() - start)
+        self._finish_cache(samples)
+        
+        failed = [path for img, (path, _) in zip(decoded, samples) if img is None]
+        if failed:
+            raise self._undecodable(failed)
+        for img, (_, label) in zip(decoded, samples):
+            images.append(img)
+            labels.append(label)
+        return images, labels
+    
+    def _list_yolo_samples(self):
+        """List samples from YOLO format"""
+        samples = []
         
         # Load class names
         classes_file = os.path.join(self.raw_data_path, 'classes.txt')
@@ -60,46 +196,36 @@ class PalmistryDataPreprocessor:
         else:
             class_names = list(self.palm_attributes.keys())
         
-        # Load images and labels
-        for img_file in os.listdir(self.raw_data_path):
+        for img_file in sorted(os.listdir(self.raw_data_path)):
             if img_file.lower().endswith(('.jpg', '.jpeg', '.png')):
                 img_path = os.path.join(self.raw_data_path, img_file)
                 label_file = img_file.rsplit('.', 1)[0] + '.txt'
                 label_path = os.path.join(self.raw_data_path, label_file)
                 
                 if os.path.exists(label_path):
-                    img = cv2.imread(img_path)
-                    if img is not None:
-                        img = cv2.resize(img, self.image_size)
-                        img = img.astype(np.float32) / 255.0
-                        images.append(img)
-                        
-                        # Read YOLO label (assuming first class in label file)
-                        with open(label_path, 'r') as f:
-                            line = f.readline().strip()
-                            if line:
-                                class_id = int(line.split()[0])
-                                labels.append(class_names[class_id])
+                    # Read YOLO label (assuming first class in label file)
+                    with open(label_path, 'r') as f:
+                        line = f.readline().strip()
+                    if line:
+                        class_id = int(line.split()[0])
+                        samples.append((img_path, class_names[class_id]))
         
-        return images, labels
+        return samples
     
-    def _load_coco_format(self):
-        """Load data from COCO format"""
-        images = []
-        labels = []
+    def _list_coco_samples(self):
+        """List samples from COCO format"""
+        samples = []
         
         # Find COCO annotation file
         json_files = [f for f in os.listdir(self.raw_data_path) if f.endswith('.json')]
         if not json_files:
-            return images, labels
+            return samples
             
         with open(os.path.join(self.raw_data_path, json_files[0]), 'r', encoding='utf-8') as f:
             coco_data = json.load(f)
         
         # Create category mapping
         categories = {cat['id']: cat['name'] for cat in coco_data['categories']}
-        
-        # Load images and annotations
         image_info = {img['id']: img for img in coco_data['images']}
         
         for annotation in coco_data['annotations']:
@@ -109,39 +235,89 @@ class PalmistryDataPreprocessor:
             if image_id in image_info:
                 img_info = image_info[image_id]
                 img_path = os.path.join(self.raw_data_path, img_info['file_name'])
-                
                 if os.path.exists(img_path):
-                    img = cv2.imread(img_path)
-                    if img is not None:
-                        img = cv2.resize(img, self.image_size)
-                        img = img.astype(np.float32) / 255.0
-                        images.append(img)
-                        labels.append(categories[category_id])
+                    samples.append((img_path, categories[category_id]))
         
-        return images, labels
+        return samples
     
-    def _load_folder_structure(self):
-        """Load data from folder structure (each class in separate folder)"""
-        images = []
-        labels = []
+    def _list_folder_samples(self):
+        """List samples from folder structure (each class in separate folder)"""
+        samples = []
         
-        for class_name in os.listdir(self.raw_data_path):
+        for class_name in sorted(os.listdir(self.raw_data_path)):
             class_path = os.path.join(self.raw_data_path, class_name)
             if os.path.isdir(class_path):
-                for img_file in os.listdir(class_path):
+                for img_file in sorted(os.listdir(class_path)):
                     if img_file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                        img_path = os.path.join(class_path, img_file)
-                        img = cv2.imread(img_path)
-                        if img is not None:
-                            img = cv2.resize(img, self.image_size)
-                            img = img.astype(np.float32) / 255.0
-                            images.append(img)
-                            labels.append(class_name)
+                        samples.append((os.path.join(class_path, img_file), class_name))
         
-        return images, labels
+        return samples
+    
+    def _load_yolo_format(self):
+        """Load data from YOLO format"""
+        return self._load_samples(self._list_yolo_samples())
+    
+    def _load_coco_format(self):
+        """Load data from COCO format"""
+        return self._load_samples(self._list_coco_samples())
     
-    def preprocess_data(self):
-        """Main preprocessing function"""
+    def _load_folder_structure(self):
+        """Load data from folder structure (each class in separate folder)"""
+        return self._load_samples(self._list_folder_samples())
+    
+    def _split_indices(self, labels_encoded):
+        """Stratified 70/15/15 split of sample indices (same split as the array path)"""
+        indices = np.arange(len(labels_encoded))
+        idx_train, idx_temp, y_train, y_temp = train_test_split(
+            indices, labels_encoded, test_size=0.3, random_state=42, stratify=labels_encoded
+        )
+        idx_val, idx_test, y_val, y_test = train_test_split(
+            idx_temp, y_temp, test_size=0.5, random_state=42, stratify=y_temp
+        )
+        return {
+            'train': (idx_train, y_train),
+            'valid': (idx_val, y_val),
+            'test': (idx_test, y_test),
+        }
+    
+    def _make_output_dirs(self):
+        for split in ('train', 'valid', 'test'):
+            os.makedirs(os.path.join(self.output_path, split), exist_ok=True)
+    
+    def _save_label_files(self):
+        """Save label encoder and class names"""
+        with open(os.path.join(self.output_path, 'label_encoder.pkl'), 'wb') as f:
+            pickle.dump(self.label_encoder, f)
+        
+        class_names = self.label_encoder.classes_
+        with open(os.path.join(self.output_path, 'class_names.txt'), 'w', encoding='utf-8') as f:
+            for name in class_names:
+                f.write(f"{name}\n")
+        return class_names
+    
+    def _save_dataset_info(self, counts):
+        """Describe the on-disk layout so the trainer knows how to read X_*.npy"""
+        info = {
+            'format': 'uint8' if self.storage_dtype == np.uint8 else 'float32',
+            'image_shape': self.preprocessor.image_shape,
+            'color_mode': self.color_mode,
+            'normalization': self.normalization,
+            'preprocessing': self.preprocessor.config,
+            'counts': counts,
+        }
+        with open(os.path.join(self.output_path, 'dataset.json'), 'w', encoding='utf-8') as f:
+            json.dump(info, f, indent=4)
+    
+    def preprocess_data(self, streaming=False, chunk_size=256):
+        """Main preprocessing function
+        
+        With ``streaming=True`` images are decoded ``chunk_size`` at a time and
+        written straight into memory-mapped .npy files, so peak memory is one
+        chunk regardless of dataset size.
+        """
+        if streaming:
+            return self._preprocess_streaming(chunk_size)
+        
         print("Loading images and labels...")
         images, labels = self.load_images_and_labels()
         
@@ -167,9 +343,7 @@ class PalmistryDataPreprocessor:
         )
         
         # Create output directories
-        os.makedirs(os.path.join(self.output_path, 'train'), exist_ok=True)
-        os.makedirs(os.path.join(self.output_path, 'valid'), exist_ok=True)
-        os.makedirs(os.path.join(self.output_path, 'test'), exist_ok=True)
+        self._make_output_dirs()
         
         # Save preprocessed data
         np.save(os.path.join(self.output_path, 'train', 'X_train.npy'), X_train)
@@ -179,26 +353,118 @@ class PalmistryDataPreprocessor:
         np.save(os.path.join(self.output_path, 'test', 'X_test.npy'), X_test)
         np.save(os.path.join(self.output_path, 'test', 'y_test.npy'), y_test)
         
-        # Save label encoder
-        with open(os.path.join(self.output_path, 'label_encoder.pkl'), 'wb') as f:
-            pickle.dump(self.label_encoder, f)
-        
-        # Save class names
-        class_names = self.label_encoder.classes_
-        with open(os.path.join(self.output_path, 'class_names.txt'), 'w', encoding='utf-8') as f:
-            for name in class_names:
-                f.write(f"{name}\n")
+        class_names = self._save_label_files()
+        self._save_dataset_info({'train': len(y_train), 'valid': len(y_val), 'test': len(y_test)})
         
         print("Data preprocessing completed!")
         print(f"Training set: {X_train.shape[0]} samples")
         print(f"Validation set: {X_val.shape[0]} samples")
         print(f"Test set: {X_test.shape[0]} samples")
         print(f"Classes: {list(class_names)}")
+    
+    def _preprocess_streaming(self, chunk_size):
+        """Streaming variant of preprocess_data backed by np.lib.format.open_memmap"""
+        print("Listing images and labels...")
+        samples = self._readable_samples(self._list_samples())
+        
+        if len(samples) == 0:
+            print("No images found! Please check your data format.")
+            return
+        
+        paths = [path for path, _ in samples]
+        labels = [label for _, label in samples]
+        print(f"Found {len(samples)} images with {len(set(labels))} classes")
+        
+        # Split is decided from the labels alone, before any pixel is decoded
+        labels_encoded = self.label_encoder.fit_transform(labels)
+        splits = self._split_indices(labels_encoded)
+        
+        self._make_output_dirs()
+        num_features = self.preprocessor.input_dim
+        file_names = {'train': ('X_train.npy', 'y_train.npy'),
+                      'valid': ('X_val.npy', 'y_val.npy'),
+                      'test': ('X_test.npy', 'y_test.npy')}
+        
+        decode_start = time.perf_counter()
+        executor = self._make_executor()
+        try:
+            for split, (indices, y) in splits.items():
+                x_name, y_name = file_names[split]
+                X = np.lib.format.open_memmap(
+                    os.path.join(self.output_path, split, x_name), mode='w+',
+                    dtype=self.storage_dtype, shape=(len(indices), num_features)
+                )
+                for start in range(0, len(indices), chunk_size):
+                    chunk = indices[start:start + chunk_size]
+                    decoded = self._decode_images([paths[idx] for idx in chunk], executor)
+                    failed = [paths[idx] for idx, img in zip(chunk, decoded) if img is None]
+                    if failed:
+                        # the split is already fixed: never leave a zero row under a real label
+                        raise self._undecodable(failed)
+                    for row, img in enumerate(decoded, start):
+                        X[row] = img.reshape(-1)
+                    X.flush()
+                del X
+                np.save(os.path.join(self.output_path, split, y_name), y)
+                print(f"{split}: wrote {len(indices)} samples")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self._report_throughput(len(samples), time.perf_counter() - decode_start)
+        self._finish_cache(samples)
+        
+        class_names = self._save_label_files()
+        self._save_dataset_info({split: len(indices) for split, (indices, _) in splits.items()})
+        
+        print("Data preprocessing completed!")
+        print(f"Training set: {len(splits['train'][0])} samples")
+        print(f"Validation set: {len(splits['valid'][0])} samples")
+        print(f"Test set: {len(splits['test'][0])} samples")
+        print(f"Classes: {list(class_names)}")
 
 if __name__ == "__main__":
-    # Configure paths
-    RAW_DATA_PATH = "data/raw"
-    OUTPUT_PATH = "data"
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Preprocess raw palm images for the ANN')
+    parser.add_argument('--raw-data-path', default='data/raw')
+    parser.add_argument('--output-path', default='data')
+    parser.add_argument('--streaming', action='store_true',
+                        help='decode in chunks into memory-mapped .npy files (bounded memory)')
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='decode/resize threads (default: all cores, 1 = serial)')
+    parser.add_argument('--cache-dir', default=None,
+                        help='preprocessed image cache (default: <output-path>/cache)')
+    parser.add_argument('--cache-max-gb', type=float, default=None,
+                        help='evict least recently used cache entries above this size')
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--compact', action='store_true',
+                        help='store uint8 pixels instead of normalized float32 (4x smaller)')
+    parser.add_argument('--image-size', type=int, nargs=2, metavar=('W', 'H'), default=None)
+    parser.add_argument('--color-mode', choices=['bgr', 'rgb', 'gray'], default=None)
+    parser.add_argument('--preprocessing-config', default=None,
+                        help="reuse a model's attr_config.json or a dataset.json preprocessing block")
+    args = parser.parse_args()
+    
+    preprocessing = {}
+    if args.preprocessing_config:
+        with open(args.preprocessing_config, 'r', encoding='utf-8') as f:
+            cfg = json.load(f)
+        preprocessing = cfg.get('preprocessing', cfg)
+    if args.image_size:
+        preprocessing = dict(preprocessing, image_size=args.image_size)
+    if args.color_mode:
+        preprocessing = dict(preprocessing, color_mode=args.color_mode)
+    
+    cache_dir = None
+    if not args.no_cache:
+        cache_dir = args.cache_dir or os.path.join(args.output_path, 'cache')
+    cache_max_bytes = int(args.cache_max_gb * 1024 ** 3) if args.cache_max_gb else None
     
-    preprocessor = PalmistryDataPreprocessor(RAW_DATA_PATH, OUTPUT_PATH)
-    preprocessor.preprocess_data()
\ No newline at end of file
+    preprocessor = PalmistryDataPreprocessor(args.raw_data_path, args.output_path,
+                                             num_workers=args.workers,
+                                             cache_dir=cache_dir,
+                                             cache_max_bytes=cache_max_bytes,
+                                             compact=args.compact,
+                                             preprocessing=preprocessing)
+    preprocessor.preprocess_data(streaming=args.streaming, chunk_size=args.chunk_size)
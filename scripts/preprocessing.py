@@ -0,0 +1,224 @@
+"""Image -> model input, shared by training and serving.
+
+``preprocess_data.py`` (building the dataset) and the web tier (handling an
+upload) both use an ``ImagePreprocessor`` built from the same description, so
+a photo becomes the same tensor on both sides. The description is the
+``preprocessing`` block of the model's attr_config.json, which train.py
+copies from the dataset's dataset.json.
+
+Steps: open (with a pixel-count guard) -> JPEG draft decode -> EXIF
+orientation -> colour conversion -> resize -> channel order -> flatten (uint8)
+-> normalize (float32 in [0, 1]). The uint8 pixels are what a compact dataset
+stores; the normalized rows are what the model sees.
+
+Check that a dataset and a model agree, image by image:
+    python scripts/preprocessing.py --model-dir model --data-path data/raw
+"""
+import io
+import os
+import threading
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# guard against decompression bombs / huge photos blowing up worker memory
+MAX_PIXELS = int(os.environ.get("PALM_MAX_PIXELS", 50_000_000))
+COLOR_MODES = ('bgr', 'rgb', 'gray')
+RESAMPLE = {'nearest': Image.NEAREST, 'bilinear': Image.BILINEAR, 'bicubic': Image.BICUBIC,
+            'lanczos': Image.LANCZOS, 'box': Image.BOX}
+_SCALE = np.float32(1.0 / 255.0)
+
+# preprocess_data.py defaults
+DEFAULT_CONFIG = {'image_size': [224, 224], 'color_mode': 'bgr', 'resample': 'bilinear'}
+# models whose attr_config.json has no preprocessing block were served with this
+LEGACY_CONFIG = {'image_size': [128, 128], 'color_mode': 'gray', 'resample': 'bicubic', 'exif_transpose': False}
+
+
+class ImageTooLargeError(ValueError):
+    """Raised when an upload exceeds MAX_PIXELS"""
+
+
+def open_image(data, max_pixels=MAX_PIXELS):
+    """Open bytes, a path or a file without decoding, rejecting oversized images from the header"""
+    try:
+        img = Image.open(io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data)
+    except Image.DecompressionBombError as e:
+        # Pillow's own guard (~179 MP) fires inside open(), before ours can
+        raise ImageTooLargeError(str(e)) from None
+    w, h = img.size
+    if w * h > max_pixels:
+        raise ImageTooLargeError(f"image is {w}x{h} = {w * h} pixels (limit {max_pixels})")
+    return img
+
+
+def normalize(pixels, out=None):
+    """uint8 pixels (rows x features) -> float32 in [0, 1], in one vectorized step"""
+    return np.multiply(pixels, _SCALE, out=out, dtype=np.float32)
+
+
+class ImagePreprocessor:
+    """Decode/resize/flatten images exactly as described by a preprocessing config"""
+
+    def __init__(self, image_size=(224, 224), color_mode='bgr', resample='bilinear', exif_transpose=True,
+                 max_pixels=MAX_PIXELS):
+        if color_mode not in COLOR_MODES:
+            raise ValueError(f"color_mode must be one of {COLOR_MODES}, got {color_mode!r}")
+        if resample not in RESAMPLE:
+            raise ValueError(f"resample must be one of {tuple(RESAMPLE)}, got {resample!r}")
+        self.image_size = (int(image_size[0]), int(image_size[1]))  # (width, height), as PIL/cv2 take it
+        self.color_mode = color_mode
+        self.resample = resample
+        self.exif_transpose = exif_transpose
+        self.max_pixels = max_pixels
+        self._buffers = threading.local()
+
+    @classmethod
+    def from_config(cls, cfg, default=DEFAULT_CONFIG, max_pixels=MAX_PIXELS):
+        """Build from attr_config.json's ``preprocessing`` block or a dataset.json
+
+        Missing keys fall back to ``default``; ``image_shape`` ([h, w, c],
+        as dataset.json has it) is accepted in place of ``image_size``.
+        """
+        cfg = dict(cfg or {})
+        if 'image_size' not in cfg and 'image_shape' in cfg:
+            h, w = cfg['image_shape'][:2]
+            cfg['image_size'] = [w, h]
+        cfg = dict(default, **cfg)
+        return cls(cfg['image_size'], cfg['color_mode'], cfg.get('resample', 'bilinear'),
+                   cfg.get('exif_transpose', True), max_pixels)
+
+    @classmethod
+    def for_model(cls, attr_cfg, max_pixels=MAX_PIXELS):
+        """The preprocessor a model was trained with, from its attr_config.json contents"""
+        cfg = attr_cfg.get('preprocessing')
+        return cls.from_config(cfg, LEGACY_CONFIG if cfg is None else DEFAULT_CONFIG, max_pixels)
+
+    @property
+    def channels(self):
+        return 1 if self.color_mode == 'gray' else 3
+
+    @property
+    def image_shape(self):
+        return [self.image_size[1], self.image_size[0], self.channels]
+
+    @property
+    def input_dim(self):
+        return self.image_size[0] * self.image_size[1] * self.channels
+
+    @property
+    def config(self):
+        """Serializable description (stored as attr_config.json ``preprocessing``)"""
+        return {
+            'image_size': list(self.image_size),
+            'image_shape': self.image_shape,
+            'color_mode': self.color_mode,
+            'resample': self.resample,
+            'exif_transpose': self.exif_transpose,
+            'normalization': 'divide_by_255',
+            'flatten': True,
+        }
+
+    def pixels(self, source):
+        """One image (bytes, path, file or PIL image) -> flat uint8 vector of ``input_dim``
+
+        JPEGs use draft mode, so the DCT decoder scales straight to near the
+        target size instead of materialising the full-resolution photo.
+        """
+        img = source if isinstance(source, Image.Image) else open_image(source, self.max_pixels)
+        mode = 'L' if self.color_mode == 'gray' else 'RGB'
+        side = max(self.image_size)
+        img.draft(mode, (side, side))
+        if self.exif_transpose:
+            img = ImageOps.exif_transpose(img)
+        img = img.convert(mode).resize(self.image_size, RESAMPLE[self.resample])
+        arr = np.asarray(img, dtype=np.uint8)
+        if self.color_mode == 'bgr':
+            arr = arr[..., ::-1]
+        return np.ascontiguousarray(arr).reshape(-1)
+
+    def pixels_batch(self, sources, executor=None):
+        """Many images -> (N, input_dim) uint8; decoded on ``executor`` when given"""
+        rows = executor.map(self.pixels, sources) if executor is not None else map(self.pixels, sources)
+        return np.stack(list(rows))
+
+    def buffer(self, rows=1):
+        """Per-thread reusable (rows, input_dim) float32 input buffer"""
+        buf = getattr(self._buffers, 'x', None)
+        if buf is None or buf.shape[0] < rows:
+            buf = self._buffers.x = np.empty((rows, self.input_dim), dtype=np.float32)
+        return buf[:rows]
+
+    def preprocess(self, source, out=None):
+        """(1, input_dim) float32 in [0, 1]; writes into ``out`` when given"""
+        return normalize(self.pixels(source)[None, :], out=out)
+
+    def preprocess_batch(self, sources, executor=None):
+        """Stack many images as uint8, then normalize the whole batch at once"""
+        return normalize(self.pixels_batch(sources, executor))
+
+    def self_check(self, input_dim):
+        """Fail fast when this preprocessing cannot feed a model with ``input_dim`` inputs
+
+        Returns the (1, input_dim) row it produced, so the caller can also
+        check what the model makes of it.
+        """
+        if self.input_dim != input_dim:
+            raise ValueError(f"preprocessing {self.image_shape} produces {self.input_dim} features "
+                             f"but the model expects {input_dim}")
+        X = self.preprocess(Image.new('RGB', (self.image_size[0] * 2, self.image_size[1] * 2)))
+        if X.shape != (1, input_dim) or X.dtype != np.float32:
+            raise ValueError(f"preprocessing produced {X.shape} {X.dtype}, expected (1, {input_dim}) float32")
+        return X
+
+    def __repr__(self):
+        w, h = self.image_size
+        return f"ImagePreprocessor({w}x{h} {self.color_mode}, {self.resample})"
+
+
+def check_parity(model_dir, image_paths, cache_dir=None):
+    """Assert the training pipeline and the server turn each image into the same tensor
+
+    Training side: PalmistryDataPreprocessor configured from the model's
+    attr_config.json, stored as uint8 and read back through the trainer's
+    NormalizedBatchSequence. Serving side: the model's ImagePreprocessor on
+    the uploaded bytes. Returns the number of images compared.
+    """
+    import json
+    from scripts.preprocess_data import PalmistryDataPreprocessor
+    from scripts.train import NormalizedBatchSequence
+
+    with open(os.path.join(model_dir, 'attr_config.json'), 'r', encoding='utf-8') as f:
+        serving = ImagePreprocessor.for_model(json.load(f))
+    training = PalmistryDataPreprocessor(None, None, num_workers=1, cache_dir=cache_dir, compact=True,
+                                         preprocessing=serving.config)
+    for path in image_paths:
+        stored = training._load_image(path).reshape(1, -1)
+        trained, _ = NormalizedBatchSequence(stored, np.zeros(1), batch_size=1, shuffle=False)[0]
+        with open(path, 'rb') as f:
+            served = serving.preprocess(f.read())
+        if not np.array_equal(trained, served):
+            diff = float(np.abs(trained - served).max())
+            raise AssertionError(f"{path}: training and serving tensors differ (max |diff| = {diff:.3g})")
+    return len(image_paths)
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from scripts.model_registry import current_version
+
+    parser = argparse.ArgumentParser(description='Check train/serve preprocessing parity for a model')
+    parser.add_argument('--model-dir', default='model')
+    parser.add_argument('--data-path', default='data/raw', help='directory of sample images')
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    _, model_dir = current_version(args.model_dir)
+    paths = []
+    for root, _, files in os.walk(args.data_path):
+        paths += [os.path.join(root, name) for name in sorted(files)
+                  if name.lower().endswith(('.jpg', '.jpeg', '.png'))]
+    n = check_parity(model_dir, paths[:args.limit])
+    print(f"{n} images: training and serving tensors are identical")
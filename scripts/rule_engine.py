@@ -0,0 +1,168 @@
+"""Interpretation rules, compiled into a lookup table.
+
+Rules live in a data file (``model/rules.json``, or ``PALM_RULES_PATH``).
+Each rule names an aspect of the reading (summary, length, ...), the slots it
+applies to and a text:
+
+    {"id": "life.length.short", "aspect": "length",
+     "when": {"line_type": "life", "length_cls": "short"}, "text": "..."}
+
+A slot left out of ``when`` (or given as "*") matches any value. For every
+aspect and every combination of (line_type, length_cls, slope_cls, curv_cls,
+breaks_cls), the most specific matching rule wins, i.e. the one with the most
+slots set. A ``null`` text leaves that aspect out of the reading.
+
+The file is checked when it is loaded:
+  - every slot value must be one of the declared attribute values;
+  - every combination must be covered by a rule in every aspect;
+  - two rules with the same specificity must never match the same
+    combination in the same aspect (a conflict).
+The winners are then compiled into a dict, so ``interpret()`` is a single
+dict lookup per request.
+
+Check a rule file and list the rules that never win:
+    python scripts/rule_engine.py model/rules.json
+"""
+import os
+import sys
+import json
+import functools
+import itertools
+from operator import itemgetter
+
+if __name__ == "__main__":
+    # run as a script: make the ``scripts`` package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.inference import HEAD_NAMES
+
+RULES_PATH = os.environ.get(
+    "PALM_RULES_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "model", "rules.json"))
+ANY = "*"
+
+
+class RuleError(ValueError):
+    """Raised for an invalid, conflicting or incomplete rule file"""
+
+
+class RuleEngine:
+    """Rules over the five attribute slots, precompiled into ``table``"""
+
+    def __init__(self, attributes, aspects, rules):
+        self.attributes = {name: list(attributes.get(name) or []) for name in HEAD_NAMES}
+        self.aspects = list(aspects)
+        self.rules = list(rules)
+        self._validate()
+        self.table, self.winners = self._compile()
+        self._slots = itemgetter(*HEAD_NAMES[1:])
+
+    @classmethod
+    def load(cls, path=RULES_PATH):
+        with open(path, "r", encoding="utf-8") as f:
+            spec = json.load(f)
+        try:
+            return cls(spec["attributes"], spec["aspects"], spec["rules"])
+        except KeyError as e:
+            raise RuleError(f"{path}: missing key {e}") from None
+
+    def _validate(self):
+        for name, values in self.attributes.items():
+            if not values or len(set(values)) != len(values) or ANY in values:
+                raise RuleError(f"attribute {name!r} needs a non-empty list of distinct values, got {values}")
+        seen = set()
+        for rule in self.rules:
+            rid = rule.get("id")
+            if not rid or rid in seen:
+                raise RuleError(f"every rule needs a unique id, got {rid!r}")
+            seen.add(rid)
+            if rule.get("aspect") not in self.aspects:
+                raise RuleError(f"rule {rid!r}: aspect must be one of {self.aspects}, got {rule.get('aspect')!r}")
+            for name, value in rule.get("when", {}).items():
+                if name not in self.attributes:
+                    raise RuleError(f"rule {rid!r}: unknown slot {name!r} (slots: {HEAD_NAMES})")
+                if value != ANY and value not in self.attributes[name]:
+                    raise RuleError(f"rule {rid!r}: {name}={value!r} is not one of {self.attributes[name]}")
+
+    def _pattern(self, rule):
+        when = rule.get("when", {})
+        return tuple(when.get(name, ANY) for name in HEAD_NAMES)
+
+    def keys(self):
+        """Every (line_type, length_cls, slope_cls, curv_cls, breaks_cls) combination"""
+        return itertools.product(*(self.attributes[name] for name in HEAD_NAMES))
+
+    def _compile(self):
+        patterns = [(self._pattern(rule), rule) for rule in self.rules]
+        table, winners = {}, set()
+        for key in self.keys():
+            reading, fired = {}, []
+            for aspect in self.aspects:
+                best, best_n = None, -1
+                for pattern, rule in patterns:
+                    if rule["aspect"] != aspect or any(p != ANY and p != k for p, k in zip(pattern, key)):
+                        continue
+                    n = sum(p != ANY for p in pattern)
+                    if n == best_n:
+                        raise RuleError(f"rules {best['id']!r} and {rule['id']!r} both match {key} "
+                                        f"for aspect {aspect!r} with the same specificity")
+                    if n > best_n:
+                        best, best_n = rule, n
+                if best is None:
+                    raise RuleError(f"no {aspect!r} rule covers {key}")
+                winners.add(best["id"])
+                fired.append(best["id"])
+                if best.get("text") is not None:
+                    reading[aspect] = best["text"]
+            table[key] = {"reading": reading, "rules": fired}
+        return table, winners
+
+    def unused(self):
+        """Ids of rules that a more specific rule always overrides"""
+        return [rule["id"] for rule in self.rules if rule["id"] not in self.winners]
+
+    def check_values(self, attr_cfg, labels=()):
+        """Fail when a model can predict a value (or accept a line_type) the rules do not know
+
+        attr_config.json must list the classes of all five heads; without them
+        the model's outputs cannot be named, let alone interpreted.
+        """
+        missing = [name for name in HEAD_NAMES if not attr_cfg.get(name)]
+        if missing:
+            raise RuleError(f"attr_config.json has no class list for {missing}; "
+                            f"the model must predict all of {HEAD_NAMES}")
+        for name in HEAD_NAMES:
+            extra = set(attr_cfg[name]) - set(self.attributes[name])
+            if name == "line_type":
+                extra |= set(labels) - set(self.attributes[name])
+            if extra:
+                raise RuleError(f"model {name} values {sorted(extra)} have no interpretation rules")
+
+    def interpret(self, line_type, pred):
+        """Reading for the chosen line_type and the predicted attributes
+
+        The returned dict is shared between calls; callers must not modify it.
+        """
+        key = (line_type, *self._slots(pred))
+        try:
+            return self.table[key]
+        except KeyError:
+            raise RuleError(f"no interpretation for {key}") from None
+
+
+@functools.lru_cache(maxsize=None)
+def default_engine():
+    """The engine for RULES_PATH, compiled on first use (the server does it while loading the model)"""
+    return RuleEngine.load(RULES_PATH)
+
+
+def interpret(line_type, pred):
+    return default_engine().interpret(line_type, pred)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else RULES_PATH
+    engine = RuleEngine.load(path)
+    print(f"{path}: {len(engine.rules)} rules, {len(engine.table)} combinations x "
+          f"{len(engine.aspects)} aspects, no conflicts or gaps")
+    for rid in engine.unused():
+        print(f"  never used: {rid}")
@@ -0,0 +1,144 @@
+"""Offline bulk scoring: stream images through preprocess + model in chunks.
+
+Usage (from the repo root):
+    python scripts/score_batch.py data/uploads --line-type life -o results.jsonl
+    python scripts/score_batch.py manifest.jsonl -o results.jsonl
+
+A manifest is either JSONL ({"path": ..., "line_type": ...} per line) or a
+plain text file with one ``path[,line_type]`` per line. Relative paths are
+resolved against the manifest's directory.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.inference import unpack_attributes, load_model, check_outputs
+from scripts.features import FeatureReducer
+from scripts.model_registry import current_version
+from scripts.preprocessing import ImagePreprocessor, normalize
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+
+
+def iter_directory(path, line_type):
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTS):
+                yield os.path.join(root, name), line_type
+
+
+def iter_manifest(path, line_type):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if path.endswith('.jsonl'):
+                entry = json.loads(line)
+                img_path, lt = entry['path'], entry.get('line_type', line_type)
+            else:
+                parts = [p.strip() for p in line.split(',')]
+                img_path, lt = parts[0], (parts[1] if len(parts) > 1 and parts[1] else line_type)
+            yield os.path.join(base, img_path), lt
+
+
+def iter_chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def load_artifacts(model_dir, chunk_size=256):
+    # a versioned model root resolves to the version named in CURRENT
+    _, model_dir = current_version(model_dir)
+    predict_fn, _, input_dim = load_model(model_dir, batch_size=chunk_size)
+    reducer = FeatureReducer.load(model_dir)
+    if reducer is not None:
+        predict_fn, input_dim = reducer.wrap(predict_fn), reducer.input_dim
+    with open(os.path.join(model_dir, 'labels.txt'), 'r', encoding='utf-8') as f:
+        labels = [l.strip() for l in f.read().splitlines() if l.strip()]
+    with open(os.path.join(model_dir, 'attr_config.json'), 'r', encoding='utf-8') as f:
+        attr_cfg = json.load(f)
+    # same decode/resize as the training set and the web tier
+    preprocessor = ImagePreprocessor.for_model(attr_cfg)
+    check_outputs(predict_fn(preprocessor.self_check(input_dim)), attr_cfg)
+    return predict_fn, preprocessor, labels, attr_cfg
+
+
+def score(items, predict_fn, preprocessor, labels, attr_cfg, out, chunk_size=256, interpret=None):
+    """Score (path, line_type) items chunk by chunk, writing one JSON line per image in input order"""
+    scored = failed = 0
+    for chunk in iter_chunks(items, chunk_size):
+        records, rows, ok = [], [], []
+        for path, line_type in chunk:
+            # same normalization as the API (app._predict_one / _predict_many)
+            line_type = line_type.strip().lower()
+            record = {'path': path, 'line_type_input': line_type}
+            records.append(record)
+            if line_type not in labels:
+                record['error'] = 'invalid line_type'
+                continue
+            try:
+                rows.append(preprocessor.pixels(path))
+                ok.append(record)
+            except (OSError, ValueError) as e:
+                record['error'] = f'cannot read image: {e}'
+
+        if ok:
+            preds = predict_fn(normalize(np.stack(rows)))
+            for row, record in enumerate(ok):
+                record['attributes'] = unpack_attributes(preds, attr_cfg, row)
+                if interpret is not None:
+                    record['interpretation'] = interpret(record['line_type_input'], record['attributes'])
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        scored += len(ok)
+        failed += len(records) - len(ok)
+    return scored, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk-score palm images to JSONL')
+    parser.add_argument('input', help='image directory or manifest (.jsonl / .txt / .csv)')
+    parser.add_argument('-o', '--output', default='-', help='output JSONL path (default: stdout)')
+    parser.add_argument('--line-type', default='life', help='line_type for entries without one')
+    parser.add_argument('--model-dir', default='model')
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--no-interpret', action='store_true', help='skip the rule engine step')
+    args = parser.parse_args()
+
+    predict_fn, preprocessor, labels, attr_cfg = load_artifacts(args.model_dir, args.chunk_size)
+    interpret = None
+    if not args.no_interpret:
+        from scripts.rule_engine import interpret
+
+    if os.path.isdir(args.input):
+        items = iter_directory(args.input, args.line_type)
+    else:
+        items = iter_manifest(args.input, args.line_type)
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    start = time.perf_counter()
+    try:
+        scored, failed = score(items, predict_fn, preprocessor, labels, attr_cfg, out, args.chunk_size, interpret)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    print(f"Scored {scored} images ({failed} failed) in {elapsed:.1f}s "
+          f"({scored / max(elapsed, 1e-9):.1f} img/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Parallel hyperparameter sweep for the Dense stack in train.py.
+
+    python scripts/sweep.py --data-path data --hidden-units 512,256,128,64,32 256,128,64 \\
+        --learning-rates 1e-3 3e-4 --batch-sizes 64 256 --parallel 4 --epochs 30
+
+Every combination (or a random ``--max-trials`` subset) runs as a trial in its
+own process, with ``cores // parallel`` TensorFlow threads each. Trials read
+the training arrays through read-only memory maps and stream them with the
+tf.data pipeline. The .npy files are therefore read from disk once and shared
+through the page cache instead of being copied into every process.
+
+After ``--prune-after`` epochs, a trial stops when its best val_loss so far is
+worse than the median of the other trials at the same epoch. The ranked table
+is written to ``<sweep-dir>/results.csv`` and ``results.json``. The best model
+is saved as a new version under ``--output-path`` (see model_registry.py).
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import itertools
+import contextlib
+import statistics
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_units(text):
+    return tuple(int(u) for u in text.split(','))
+
+
+def make_trials(hidden_units, learning_rates, batch_sizes, max_trials=None, seed=0):
+    """Grid of trial parameters, optionally a random subset of it"""
+    grid = [{'hidden_units': list(units), 'learning_rate': lr, 'batch_size': bs}
+            for units, lr, bs in itertools.product(hidden_units, learning_rates, batch_sizes)]
+    if max_trials and max_trials < len(grid):
+        grid = random.Random(seed).sample(grid, max_trials)
+    return [dict(params, trial=i) for i, params in enumerate(grid)]
+
+
+def _median_pruner(trial_id, reports, prune_after, min_peers):
+    """Keras callback stopping a trial whose val_loss is above the running median"""
+    from tensorflow.keras.callbacks import Callback
+
+    class MedianPruner(Callback):
+        def __init__(self):
+            super().__init__()
+            self.pruned_at = None
+            self.best = float('inf')
+            self.history = []
+
+        def on_epoch_end(self, epoch, logs=None):
+            self.best = min(self.best, float((logs or {}).get('val_loss', float('inf'))))
+            self.history.append(self.best)
+            # Manager dict proxies only see reassignment, not in-place appends
+            reports[trial_id] = list(self.history)
+            if epoch + 1 < prune_after:
+                return
+            peers = [losses[epoch] for tid, losses in reports.items() if tid != trial_id and len(losses) > epoch]
+            if len(peers) >= min_peers and self.best > statistics.median(peers):
+                self.pruned_at = epoch + 1
+                self.model.stop_training = True
+
+    return MedianPruner()
+
+
+def run_trial(params, settings, reports):
+    """Train one configuration in a worker process; returns a result row"""
+    trial_dir = os.path.join(settings['sweep_dir'], f"trial_{params['trial']:03d}")
+    os.makedirs(trial_dir, exist_ok=True)
+    result = dict(params, status='failed', best_val_loss=None, best_val_accuracy=None,
+                  epochs=0, pruned_at=None, samples_per_sec=None, seconds=None, model_path=None)
+    t0 = time.perf_counter()
+    with open(os.path.join(trial_dir, 'log.txt'), 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        try:
+            from scripts.train import PalmistryANNTrainer, setup_cpu
+
+            setup_cpu(settings['threads'], 1, settings['mixed_precision'])
+            trainer = PalmistryANNTrainer(settings['data_path'], trial_dir)
+            X_train, y_train, X_val, y_val = trainer.load_data(mmap=True)
+            pruner = _median_pruner(params['trial'], reports, settings['prune_after'], settings['min_peers'])
+            history = trainer.train_model(
+                X_train, y_train, X_val, y_val, epochs=settings['epochs'], batch_size=params['batch_size'],
+                use_tf_data=True, learning_rate=params['learning_rate'], jit_compile=settings['jit'],
+                hidden_units=tuple(params['hidden_units']), extra_callbacks=[pruner],
+                patience=settings['patience'], verbose=0)
+            h = history.history
+            best = min(range(len(h['val_loss'])), key=h['val_loss'].__getitem__)
+            result.update(status='pruned' if pruner.pruned_at else 'complete', epochs=len(h['val_loss']),
+                          pruned_at=pruner.pruned_at, best_val_loss=float(h['val_loss'][best]),
+                          best_val_accuracy=float(h['val_accuracy'][best]),
+                          samples_per_sec=float(statistics.median(h['samples_per_sec'])))
+            if not pruner.pruned_at:
+                result['model_path'] = os.path.join(trial_dir, 'model.h5')
+                trainer.model.save(result['model_path'])
+        except Exception as e:
+            print(f"Trial failed: {type(e).__name__}: {e}")
+            result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - t0
+    return result
+
+
+def rank(results):
+    """Completed trials by val_loss, then pruned ones, then failures"""
+    order = {'complete': 0, 'pruned': 1, 'failed': 2}
+    return sorted(results, key=lambda r: (order[r['status']], r['best_val_loss'] if r['best_val_loss'] is not None
+                                          else float('inf')))
+
+
+def write_results(results, sweep_dir):
+    fields = ['rank', 'trial', 'status', 'hidden_units', 'learning_rate', 'batch_size', 'best_val_loss',
+              'best_val_accuracy', 'epochs', 'pruned_at', 'samples_per_sec', 'seconds']
+    with open(os.path.join(sweep_dir, 'results.csv'), 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+        writer.writeheader()
+        for i, r in enumerate(results, 1):
+            writer.writerow(dict(r, rank=i, hidden_units='-'.join(map(str, r['hidden_units']))))
+    with open(os.path.join(sweep_dir, 'results.json'), 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+
+def print_table(results):
+    print(f"\n{'rank':>4s} {'trial':>5s} {'status':9s} {'hidden units':22s} {'lr':>8s} {'batch':>5s} "
+          f"{'val_loss':>9s} {'val_acc':>8s} {'epochs':>6s} {'samples/s':>9s}")
+    for i, r in enumerate(results, 1):
+        loss = f"{r['best_val_loss']:.4f}" if r['best_val_loss'] is not None else '-'
+        acc = f"{r['best_val_accuracy']:.4f}" if r['best_val_accuracy'] is not None else '-'
+        rate = f"{r['samples_per_sec']:.0f}" if r['samples_per_sec'] else '-'
+        print(f"{i:4d} {r['trial']:5d} {r['status']:9s} {'-'.join(map(str, r['hidden_units'])):22s} "
+              f"{r['learning_rate']:8.2g} {r['batch_size']:5d} {loss:>9s} {acc:>8s} {r['epochs']:6d} {rate:>9s}")
+
+
+def save_best(best, data_path, output_path, publish):
+    """Re-export the best trial's model as a registry version"""
+    from tensorflow import keras
+    from scripts.train import PalmistryANNTrainer
+
+    trainer = PalmistryANNTrainer(data_path, output_path)
+    trainer.load_data(mmap=True)  # label encoder / class count for the artifacts
+    trainer.model = keras.models.load_model(best['model_path'], compile=False)
+    trainer.save_model_artifacts(publish=publish)
+    return trainer.version, trainer.published
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter sweep with median pruning')
+    parser.add_argument('--data-path', default='data')
+    parser.add_argument('--output-path', default='model', help='model root that receives the best version')
+    parser.add_argument('--sweep-dir', default=None, help='default: sweeps/<timestamp>')
+    parser.add_argument('--hidden-units', type=parse_units, nargs='+', default=[(512, 256, 128, 64, 32)],
+                        help='comma-separated widths per candidate, e.g. 512,256,128 256,128')
+    parser.add_argument('--learning-rates', type=float, nargs='+', default=[1e-3, 3e-4])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[64, 256])
+    parser.add_argument('--max-trials', type=int, default=None, help='random subset of the grid')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--patience', type=int, default=5, help='early stopping patience per trial')
+    parser.add_argument('--parallel', type=int, default=None, help='concurrent trials (default: cores / 2)')
+    parser.add_argument('--prune-after', type=int, default=3, help='epochs before a trial can be pruned')
+    parser.add_argument('--min-peers', type=int, default=2, help='other trials needed to compute a median')
+    parser.add_argument('--mixed-precision', choices=['auto', 'bfloat16', 'off'], default='off')
+    parser.add_argument('--no-jit', action='store_true')
+    parser.add_argument('--publish', action='store_true', help='make the best model CURRENT')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    cores = os.cpu_count() or 1
+    parallel = args.parallel or max(1, cores // 2)
+    sweep_dir = args.sweep_dir or os.path.join('sweeps', time.strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(sweep_dir, exist_ok=True)
+
+    trials = make_trials(args.hidden_units, args.learning_rates, args.batch_sizes, args.max_trials, args.seed)
+    settings = {
+        'data_path': args.data_path, 'sweep_dir': sweep_dir, 'epochs': args.epochs, 'patience': args.patience,
+        'threads': max(1, cores // parallel), 'prune_after': args.prune_after, 'min_peers': args.min_peers,
+        'mixed_precision': args.mixed_precision, 'jit': not args.no_jit,
+    }
+    print(f"Running {len(trials)} trials, {parallel} at a time with {settings['threads']} threads each "
+          f"(logs in {sweep_dir}/trial_*/log.txt)")
+
+    # spawn: TensorFlow's thread pools are not fork-safe
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    t0 = time.perf_counter()
+    with ctx.Manager() as manager, ProcessPoolExecutor(max_workers=parallel, mp_context=ctx) as pool:
+        reports = manager.dict()
+        futures = [pool.submit(run_trial, params, settings, reports) for params in trials]
+        for future in as_completed(futures):
+            r = future.result()
+            results.append(r)
+            loss = f"{r['best_val_loss']:.4f}" if r['best_val_loss'] is not None else '-'
+            print(f"[{len(results)}/{len(trials)}] trial {r['trial']} {r['status']} "
+                  f"after {r['epochs']} epochs: val_loss {loss} ({r['seconds']:.0f}s)")
+
+    results = rank(results)
+    write_results(results, sweep_dir)
+    print_table(results)
+    print(f"\nSweep finished in {time.perf_counter() - t0:.0f}s; results in {sweep_dir}/results.csv")
+
+    best = results[0] if results and results[0]['status'] == 'complete' else None
+    if best is None:
+        print("No trial completed; nothing to save.")
+        return
+    version, published = save_best(best, args.data_path, args.output_path, args.publish)
+    print(f"Best trial {best['trial']} saved as model version {version} in {args.output_path}"
+          + (" and published as CURRENT" if published else ""))
+
+
+if __name__ == "__main__":
+    main()
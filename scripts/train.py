@@ -1,4 +1,5 @@
 import os
+import time
 import numpy as np
 import pickle
 import json
@@ -7,9 +8,20 @@ import tensorflow as tf
 from tensorflow.keras import Sequential
 from tensorflow.keras.layers import Dense
 from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.utils import to_categorical
-from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+from tensorflow.keras.utils import to_categorical, Sequence
+from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, Callback, LearningRateScheduler
 import matplotlib.pyplot as plt
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.numpy_backend import export_dense_model, NumpyDenseModel, check_parity
+from scripts import model_registry
+from scripts.model_manager import load_checked
+from scripts.features import FeatureReducer
+from scripts.preprocessing import ImagePreprocessor
+
+# Widths of the hidden Dense layers (dense_1 ... dense_N)
+DEFAULT_HIDDEN_UNITS = (512, 256, 128, 64, 32)
 
 # Configure GPU settings
 def setup_gpu():
@@ -32,11 +44,150 @@ def setup_gpu():
         return False
 
 
+def cpu_supports_bfloat16():
+    """True when the CPU has native bfloat16 (AVX512-BF16 or AMX); Linux only"""
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def setup_cpu(intra_op_threads=None, inter_op_threads=2, mixed_precision='auto'):
+    """Configure TensorFlow for GPU-less training; call before any op runs
+    
+    Intra-op threads parallelise each matmul (default: all cores); a couple of
+    inter-op threads overlap independent ops and the input pipeline.
+    ``mixed_precision`` is 'auto' (bfloat16 if the CPU has it), 'bfloat16'
+    or 'off'. Returns the settings that were applied.
+    """
+    intra_op_threads = intra_op_threads or os.cpu_count() or 1
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    
+    bf16 = cpu_supports_bfloat16()
+    use_bf16 = mixed_precision == 'bfloat16' or (mixed_precision == 'auto' and bf16)
+    if mixed_precision == 'bfloat16' and not bf16:
+        print(">> bfloat16 requested but the CPU has no native support; it will be emulated (slow)")
+    keras.mixed_precision.set_global_policy('mixed_bfloat16' if use_bf16 else 'float32')
+    
+    settings = {
+        'intra_op_threads': intra_op_threads,
+        'inter_op_threads': inter_op_threads,
+        'cpu_bfloat16': bf16,
+        'precision_policy': keras.mixed_precision.global_policy().name,
+    }
+    print(f">> CPU training: {settings}")
+    return settings
+
+
+def scaled_learning_rate(base_lr, batch_size, base_batch_size=32, rule='linear'):
+    """Learning rate for ``batch_size`` given one tuned at ``base_batch_size``"""
+    ratio = batch_size / base_batch_size
+    if rule == 'linear':
+        return base_lr * ratio
+    if rule == 'sqrt':
+        return base_lr * np.sqrt(ratio)
+    if rule == 'none':
+        return base_lr
+    raise ValueError(f"unknown learning rate scaling rule {rule!r}")
+
+
+def warmup_schedule(target_lr, warmup_epochs, start_lr):
+    """Ramp linearly from ``start_lr`` to ``target_lr`` over the first epochs
+    
+    Large batches with a scaled-up learning rate diverge early without it.
+    """
+    def schedule(epoch, lr):
+        if epoch >= warmup_epochs:
+            return float(target_lr)
+        return float(start_lr + (target_lr - start_lr) * (epoch + 1) / warmup_epochs)
+    return schedule
+
+
+class ThroughputLogger(Callback):
+    """Log training samples/sec per epoch (also recorded in ``history``)
+    
+    Only the training batches are timed: the clock stops when validation
+    starts, so the rate does not depend on the validation-set size.
+    Validation time is logged separately as ``val_seconds``.
+    """
+    
+    def __init__(self, num_samples):
+        super().__init__()
+        self.num_samples = num_samples
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self._start = time.perf_counter()
+        self._train_end = None
+    
+    def on_test_begin(self, logs=None):
+        # fit() runs validation through the same callbacks after the last train batch
+        if self._train_end is None:
+            self._train_end = time.perf_counter()
+    
+    def on_epoch_end(self, epoch, logs=None):
+        now = time.perf_counter()
+        train_end = self._train_end or now
+        elapsed, val_elapsed = train_end - self._start, now - train_end
+        rate = self.num_samples / elapsed if elapsed > 0 else 0.0
+        if logs is not None:
+            logs['samples_per_sec'] = rate
+            logs['epoch_seconds'] = elapsed
+            logs['val_seconds'] = val_elapsed
+        print(f"Epoch {epoch + 1}: {rate:,.0f} samples/sec ({elapsed:.1f}s training, {val_elapsed:.1f}s validation)")
+
+
+class NormalizedBatchSequence(Sequence):
+    """Batches from a memory-mapped uint8 array, normalized to float32 on the fly"""
+    
+    def __init__(self, X, y, batch_size=32, shuffle=True, scale=1.0 / 255.0):
+        super().__init__()
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.scale = np.float32(scale)
+        self.indices = np.arange(len(X))
+        self.on_epoch_end()
+    
+    def __len__(self):
+        return int(np.ceil(len(self.X) / self.batch_size))
+    
+    def __getitem__(self, idx):
+        # Sorted indices keep reads from the memmap mostly sequential
+        batch = np.sort(self.indices[idx * self.batch_size:(idx + 1) * self.batch_size])
+        X = self.X[batch].astype(np.float32)
+        X *= self.scale
+        return X, self.y[batch]
+    
+    def on_epoch_end(self):
+        if self.shuffle:
+            np.random.shuffle(self.indices)
+
+
+def augment_batch(images, image_shape, max_delta=0.1, contrast_range=(0.9, 1.1)):
+    """Cheap per-image augmentations on a flattened, normalized batch"""
+    batch = tf.shape(images)[0]
+    x = tf.reshape(images, tf.concat([[batch], image_shape], axis=0))
+    x = tf.image.random_flip_left_right(x)
+    
+    delta = tf.random.uniform([batch, 1, 1, 1], -max_delta, max_delta)
+    factor = tf.random.uniform([batch, 1, 1, 1], contrast_range[0], contrast_range[1])
+    mean = tf.reduce_mean(x, axis=[1, 2, 3], keepdims=True)
+    x = (x - mean) * factor + mean + delta
+    x = tf.clip_by_value(x, 0.0, 1.0)
+    return tf.reshape(x, [batch, -1])
+
+
 class PalmistryANNTrainer:
     def __init__(self, data_path, output_path):
         self.data_path = data_path
         self.output_path = output_path
         self.model = None
+        # optional fitted stage between the stored pixels and the model (scripts/features.py)
+        self.reducer = None
         
         # Palm reading attributes with detailed descriptions
         self.palm_attributes = {
@@ -62,13 +213,107 @@ class PalmistryANNTrainer:
             }
         }
     
-    def load_data(self):
+    def _dataset_info(self):
+        """Contents of dataset.json written by preprocess_data.py (if any)"""
+        info_path = os.path.join(self.data_path, 'dataset.json')
+        if not os.path.exists(info_path):
+            return {}
+        with open(info_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def dataset_preprocessor(self):
+        """The ImagePreprocessor that built this dataset (copied into attr_config.json)"""
+        info = self._dataset_info()
+        return ImagePreprocessor.from_config(info.get('preprocessing', info))
+    
+    def _dataset_format(self):
+        """'uint8' for the compact format, 'float32' otherwise"""
+        return self._dataset_info().get('format', 'float32')
+    
+    def _load_features(self, split, name, mmap=False):
+        path = os.path.join(self.data_path, split, name)
+        if mmap or self._dataset_format() == 'uint8':
+            # Compact format stays on disk; batches are normalized as they are read
+            return np.load(path, mmap_mode='r')
+        return np.load(path)
+    
+    def _batch_sequence(self, X, y, shuffle=False, batch_size=32):
+        """Normalizing batch reader for compact (uint8) arrays"""
+        return NormalizedBatchSequence(X, y, batch_size=batch_size, shuffle=shuffle)
+    
+    def make_dataset(self, X, y, batch_size=32, training=False, shuffle_buffer=10000,
+                     augment=False, cache=False):
+        """tf.data pipeline over (memory-mapped) arrays
+        
+        Rows are gathered from disk one batch at a time, normalized to float32,
+        optionally augmented in parallel and prefetched. With ``cache`` the
+        normalized dataset is kept in memory after the first epoch.
+        """
+        num_samples = len(X)
+        scale = np.float32(1.0 / 255.0) if X.dtype == np.uint8 else np.float32(1.0)
+        
+        def read_rows(indices):
+            # Sorted gather keeps memmap reads mostly sequential
+            order = np.argsort(indices)
+            rows = np.empty((len(indices), X.shape[1]), dtype=np.float32)
+            rows[order] = X[indices[order]]
+            rows *= scale
+            return rows, y[indices].astype(np.float32)
+        
+        def read_batch(indices):
+            rows, labels = tf.numpy_function(read_rows, [indices], (tf.float32, tf.float32))
+            rows.set_shape((None, X.shape[1]))
+            labels.set_shape((None,) + y.shape[1:])
+            return rows, labels
+        
+        ds = tf.data.Dataset.range(num_samples)
+        if cache:
+            # Read everything once in large chunks, then shuffle cached rows
+            ds = ds.batch(1024).map(read_batch, num_parallel_calls=tf.data.AUTOTUNE)
+            ds = ds.unbatch().cache()
+            if training:
+                ds = ds.shuffle(min(shuffle_buffer, num_samples), reshuffle_each_iteration=True)
+            ds = ds.batch(batch_size)
+        else:
+            if training:
+                ds = ds.shuffle(min(shuffle_buffer, num_samples), reshuffle_each_iteration=True)
+            ds = ds.batch(batch_size).map(read_batch, num_parallel_calls=tf.data.AUTOTUNE)
+        
+        if augment and training:
+            image_shape = self._dataset_info().get('image_shape', [224, 224, 3])
+            if int(np.prod(image_shape)) == X.shape[1]:
+                ds = ds.map(lambda xb, yb: (augment_batch(xb, image_shape), yb),
+                            num_parallel_calls=tf.data.AUTOTUNE)
+            else:
+                print(f"Skipping augmentation: {X.shape[1]} features do not match image shape {image_shape}")
+        
+        return ds.prefetch(tf.data.AUTOTUNE)
+    
+    def fit_feature_reducer(self, X_train, spec):
+        """Fit a FeatureReducer (e.g. 'gray+pool4', 'pca256') on the training rows"""
+        info = self._dataset_info()
+        image_shape = info.get('image_shape', [224, 224, 3])
+        if int(np.prod(image_shape)) != X_train.shape[1]:
+            raise ValueError(f"{X_train.shape[1]} features do not match image shape {image_shape}")
+        reducer = FeatureReducer.from_spec(spec, image_shape, info.get('color_mode', 'bgr'))
+        start = time.perf_counter()
+        self.reducer = reducer.fit(X_train)
+        print(f"Fitted {reducer} in {time.perf_counter() - start:.1f}s")
+        return reducer
+    
+    def reduce_features(self, X):
+        """Apply the fitted reducer (in chunks, so memmaps are never fully loaded)"""
+        if self.reducer is None:
+            return X
+        return self.reducer.transform_all(X)
+    
+    def load_data(self, mmap=False):
         """Load preprocessed data"""
         print("Loading preprocessed data...")
         
-        X_train = np.load(os.path.join(self.data_path, 'train', 'X_train.npy'))
+        X_train = self._load_features('train', 'X_train.npy', mmap)
         y_train = np.load(os.path.join(self.data_path, 'train', 'y_train.npy'))
-        X_val = np.load(os.path.join(self.data_path, 'valid', 'X_val.npy'))
+        X_val = self._load_features('valid', 'X_val.npy', mmap)
         y_val = np.load(os.path.join(self.data_path, 'valid', 'y_val.npy'))
         
         # Load label encoder
@@ -81,53 +326,65 @@ class PalmistryANNTrainer:
         y_train_cat = to_categorical(y_train, self.num_classes)
         y_val_cat = to_categorical(y_val, self.num_classes)
         
-        print(f"Training data shape: {X_train.shape}")
+        print(f"Training data shape: {X_train.shape} ({X_train.dtype})")
         print(f"Validation data shape: {X_val.shape}")
         print(f"Number of classes: {self.num_classes}")
         print(f"Classes: {list(self.label_encoder.classes_)}")
         
         return X_train, y_train_cat, X_val, y_val_cat
     
-    def create_model(self, input_shape):
+    def create_model(self, input_shape, hidden_units=DEFAULT_HIDDEN_UNITS):
         """Create ANN model with only Dense layers"""
-        model = Sequential([
-            # Input layer
-            Dense(512, activation='relu', input_shape=input_shape, name='dense_1'),
-            
-            # Hidden layers
-            Dense(256, activation='relu', name='dense_2'),
-            Dense(128, activation='relu', name='dense_3'),
-            Dense(64, activation='relu', name='dense_4'),
-            Dense(32, activation='relu', name='dense_5'),
-            
-            # Output layer
-            Dense(self.num_classes, activation='softmax', name='output')
-        ])
+        # Input layer
+        layers = [Dense(hidden_units[0], activation='relu', input_shape=input_shape, name='dense_1')]
+        
+        # Hidden layers
+        layers += [Dense(units, activation='relu', name=f'dense_{i}')
+                   for i, units in enumerate(hidden_units[1:], start=2)]
+        
+        # Output layer (float32 softmax even under a mixed precision policy)
+        layers.append(Dense(self.num_classes, activation='softmax', name='output', dtype='float32'))
+        
+        model = Sequential(layers)
         
         return model
     
-    def compile_model(self, model):
-        """Compile the model"""
+    def compile_model(self, model, learning_rate=0.001, jit_compile=False):
+        """Compile the model; ``jit_compile`` fuses the train step with XLA"""
         model.compile(
-            optimizer=Adam(learning_rate=0.001),
+            optimizer=Adam(learning_rate=learning_rate),
             loss='categorical_crossentropy',
-            metrics=['accuracy']
+            metrics=['accuracy'],
+            jit_compile=jit_compile
         )
         
         return model
     
-    def train_model(self, X_train, y_train, X_val, y_val, epochs=100):
-        """Train the model"""
+    def train_model(self, X_train, y_train, X_val, y_val, epochs=100, batch_size=32,
+                    use_tf_data=False, augment=False, cache=False, shuffle_buffer=10000,
+                    learning_rate=0.001, jit_compile=False, warmup_epochs=0,
+                    hidden_units=DEFAULT_HIDDEN_UNITS, extra_callbacks=None, patience=10, verbose=1):
+        """Train the model
+        
+        ``use_tf_data`` streams batches from disk through ``make_dataset``
+        (bounded shuffle buffer, parallel augmentation, prefetch); ``cache``
+        keeps the decoded dataset in memory when it fits. With
+        ``warmup_epochs`` the learning rate ramps up to ``learning_rate``
+        (use with large batches and ``scaled_learning_rate``).
+        ``extra_callbacks`` are appended to the defaults (e.g. a pruner).
+        """
         print("Creating and compiling model...")
         
         # Create model
         input_shape = (X_train.shape[1],)
-        self.model = self.create_model(input_shape)
-        self.model = self.compile_model(self.model)
+        self.model = self.create_model(input_shape, hidden_units)
+        start_lr = learning_rate / max(1, warmup_epochs) if warmup_epochs else learning_rate
+        self.model = self.compile_model(self.model, learning_rate=start_lr, jit_compile=jit_compile)
         
         # Print model summary
-        print("\nModel Architecture:")
-        self.model.summary()
+        if verbose:
+            print("\nModel Architecture:")
+            self.model.summary()
         
         # Setup callbacks
         os.makedirs(self.output_path, exist_ok=True)
@@ -135,68 +392,131 @@ class PalmistryANNTrainer:
         callbacks = [
             EarlyStopping(
                 monitor='val_loss',
-                patience=10,
+                patience=patience,
                 restore_best_weights=True,
-                verbose=1
+                verbose=verbose
             ),
             ModelCheckpoint(
                 filepath=os.path.join(self.output_path, 'best_model.h5'),
                 monitor='val_accuracy',
                 save_best_only=True,
-                verbose=1
-            )
-        ]
+                verbose=verbose
+            ),
+            ThroughputLogger(len(X_train))
+        ] + list(extra_callbacks or [])
+        if warmup_epochs:
+            callbacks.append(LearningRateScheduler(warmup_schedule(learning_rate, warmup_epochs, start_lr)))
+        print(f"Batch size {batch_size}, learning rate {learning_rate:g}"
+              + (f" (warm-up over {warmup_epochs} epochs)" if warmup_epochs else "")
+              + (", XLA jit" if jit_compile else ""))
         
         print("\nStarting training...")
         
         # Train model
-        history = self.model.fit(
-            X_train, y_train,
-            validation_data=(X_val, y_val),
-            epochs=epochs,
-            batch_size=32,
-            callbacks=callbacks,
-            verbose=1
-        )
+        print(f"Trainable parameters: {self.model.count_params():,}")
+        if use_tf_data:
+            train_ds = self.make_dataset(X_train, y_train, batch_size, training=True,
+                                         shuffle_buffer=shuffle_buffer, augment=augment, cache=cache)
+            val_ds = self.make_dataset(X_val, y_val, batch_size, cache=cache)
+            history = self.model.fit(
+                train_ds,
+                validation_data=val_ds,
+                epochs=epochs,
+                callbacks=callbacks,
+                verbose=verbose
+            )
+        elif X_train.dtype == np.uint8:
+            history = self.model.fit(
+                self._batch_sequence(X_train, y_train, shuffle=True, batch_size=batch_size),
+                validation_data=self._batch_sequence(X_val, y_val),
+                epochs=epochs,
+                callbacks=callbacks,
+                verbose=verbose
+            )
+        else:
+            history = self.model.fit(
+                X_train, y_train,
+                validation_data=(X_val, y_val),
+                epochs=epochs,
+                batch_size=batch_size,
+                callbacks=callbacks,
+                verbose=verbose
+            )
         
         return history
     
-    def save_model_artifacts(self):
-        """Save model and related files"""
+    def save_model_artifacts(self, publish=True):
+        """Save model and related files as a new version under output_path/versions
+
+        With ``publish`` the version becomes CURRENT, which running servers
+        pick up without a restart (see scripts/model_registry.py). A version
+        the server would refuse to load is saved but never published.
+        """
         print("Saving model artifacts...")
+        version = model_registry.new_version_id(self.output_path)
+        version_path = model_registry.begin_version(self.output_path, version)
         
         # Save final model
-        self.model.save(os.path.join(self.output_path, 'model.h5'))
+        self.model.save(os.path.join(version_path, 'model.h5'))
+        
+        # Export TensorFlow-free serving artifact (loaded by app.py at startup)
+        serving_path = os.path.join(version_path, 'serving')
+        export_dense_model(self.model, serving_path)
+        if self.reducer is not None:
+            self.reducer.save(version_path)
+        # bfloat16 compute (mixed precision) only matches float32 to a few digits
+        atol = 1e-4 if self.model.layers[0].compute_dtype == 'float32' else 5e-2
+        max_diff, _ = check_parity(self.model, NumpyDenseModel.load(serving_path), atol=atol)
+        print(f"NumPy serving backend matches Keras (max |diff| = {max_diff:.2g})")
         
         # Create labels.txt file
-        labels_path = os.path.join(self.output_path, 'labels.txt')
+        labels_path = os.path.join(version_path, 'labels.txt')
         with open(labels_path, 'w', encoding='utf-8') as f:
             for label in self.label_encoder.classes_:
                 f.write(f"{label}\n")
         
-        # Create attr_config.json file
+        # Create attr_config.json file; the server rebuilds its ImagePreprocessor from
+        # 'preprocessing', so uploads are decoded exactly like this dataset was
+        preprocessor = self.dataset_preprocessor()
         attr_config = {
             'model_info': {
                 'model_type': 'ANN',
-                'input_shape': [224, 224, 3],
+                'input_shape': preprocessor.image_shape,
                 'num_classes': self.num_classes,
                 'classes': list(self.label_encoder.classes_)
             },
             'palm_attributes': self.palm_attributes,
-            'preprocessing': {
-                'image_size': [224, 224],
-                'normalization': 'divide_by_255',
-                'flatten': True
-            }
+            'preprocessing': dict(
+                preprocessor.config,
+                feature_reduction=self.reducer.config if self.reducer is not None else None
+            )
         }
         
-        attr_config_path = os.path.join(self.output_path, 'attr_config.json')
+        attr_config_path = os.path.join(version_path, 'attr_config.json')
         with open(attr_config_path, 'w', encoding='utf-8') as f:
             json.dump(attr_config, f, ensure_ascii=False, indent=4)
         
-        print(f"Model saved to: {os.path.join(self.output_path, 'model.h5')}")
-        print(f"Labels saved to: {labels_path}")
-        print(f"Config saved to: {attr_config_path}")
+        # Only complete versions become visible under versions/
+        version_path = model_registry.commit_version(self.output_path, version, version_path)
+        print(f"Model version {version} saved to: {version_path}")
+        refused = None
+        if publish:
+            # the server runs these checks on every load; a version that fails them
+            # would crash a fresh server and fail every reload, so keep it off CURRENT
+            try:
+                load_checked(version_path)
+            except ValueError as e:
+                refused = e
+                publish = False
+        if publish:
+            model_registry.publish(self.output_path, version)
+            print("Published as CURRENT")
+        elif refused is not None:
+            print(f"NOT published: the server would refuse this version ({refused})")
+        else:
+            print(f"Not published; run: python scripts/model_registry.py --root {self.output_path} publish {version}")
+        self.version = version
+        self.published = publish
     
     def plot_training_history(self, history):
         """Plot training history"""
@@ -229,11 +549,15 @@ class PalmistryANNTrainer:
         if os.path.exists(os.path.join(self.data_path, 'test', 'X_test.npy')):
             print("Evaluating on test set...")
             
-            X_test = np.load(os.path.join(self.data_path, 'test', 'X_test.npy'))
+            X_test = self.reduce_features(self._load_features('test', 'X_test.npy'))
             y_test = np.load(os.path.join(self.data_path, 'test', 'y_test.npy'))
             y_test_cat = to_categorical(y_test, self.num_classes)
             
-            test_loss, test_accuracy = self.model.evaluate(X_test, y_test_cat, verbose=1)
+            if X_test.dtype == np.uint8:
+                test_loss, test_accuracy = self.model.evaluate(
+                    self._batch_sequence(X_test, y_test_cat), verbose=1)
+            else:
+                test_loss, test_accuracy = self.model.evaluate(X_test, y_test_cat, verbose=1)
             print(f"Test Accuracy: {test_accuracy:.4f}")
             print(f"Test Loss: {test_loss:.4f}")
             
@@ -242,23 +566,71 @@ class PalmistryANNTrainer:
             print("No test data found.")
             return None, None
 
+def parse_args():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Train the palmistry ANN')
+    parser.add_argument('--data-path', default='data')
+    parser.add_argument('--output-path', default='model')
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='default 32, or 256 with --cpu')
+    parser.add_argument('--tf-data', action='store_true',
+                        help='stream batches from disk with a tf.data pipeline')
+    parser.add_argument('--augment', action='store_true', help='random flip/brightness/contrast (tf.data only)')
+    parser.add_argument('--cache', action='store_true', help='cache the dataset in memory (tf.data only)')
+    parser.add_argument('--shuffle-buffer', type=int, default=10000)
+    parser.add_argument('--learning-rate', type=float, default=0.001,
+                        help='learning rate tuned for --base-batch-size')
+    parser.add_argument('--base-batch-size', type=int, default=32)
+    parser.add_argument('--lr-scaling', choices=['linear', 'sqrt', 'none'], default='linear',
+                        help='how the learning rate scales with batch size / base batch size')
+    parser.add_argument('--warmup-epochs', type=int, default=None,
+                        help='learning rate warm-up epochs (default 5 when the batch is larger than the base)')
+    cpu = parser.add_argument_group('CPU training')
+    cpu.add_argument('--cpu', action='store_true',
+                     help='CPU-optimised mode: thread pools, XLA, bfloat16 when supported, large batches')
+    cpu.add_argument('--intra-op-threads', type=int, default=None, help='default: all cores')
+    cpu.add_argument('--inter-op-threads', type=int, default=2)
+    cpu.add_argument('--mixed-precision', choices=['auto', 'bfloat16', 'off'], default='auto')
+    cpu.add_argument('--no-jit', action='store_true', help='disable XLA compilation of the train step')
+    parser.add_argument('--reduce', default='none',
+                        help="feature reduction before the model, e.g. 'gray+pool4', 'pool2+pca256', "
+                             "'edges+pool4' (see scripts/features.py)")
+    parser.add_argument('--no-publish', action='store_true',
+                        help='save the new model version without making it CURRENT')
+    return parser.parse_args()
+
 def main():
-    # Configure paths
-    DATA_PATH = "data"
-    OUTPUT_PATH = "model"
+    args = parse_args()
+    if args.cpu:
+        setup_cpu(args.intra_op_threads, args.inter_op_threads, args.mixed_precision)
+    batch_size = args.batch_size or (256 if args.cpu else 32)
+    learning_rate = scaled_learning_rate(args.learning_rate, batch_size, args.base_batch_size, args.lr_scaling)
+    warmup_epochs = args.warmup_epochs
+    if warmup_epochs is None:
+        warmup_epochs = 5 if batch_size > args.base_batch_size and args.lr_scaling != 'none' else 0
     
     # Initialize trainer
-    trainer = PalmistryANNTrainer(DATA_PATH, OUTPUT_PATH)
+    trainer = PalmistryANNTrainer(args.data_path, args.output_path)
     
     try:
         # Load data
-        X_train, y_train, X_val, y_val = trainer.load_data()
+        X_train, y_train, X_val, y_val = trainer.load_data(mmap=args.tf_data or args.reduce != 'none')
+        if args.reduce != 'none':
+            trainer.fit_feature_reducer(X_train, args.reduce)
+            X_train, X_val = trainer.reduce_features(X_train), trainer.reduce_features(X_val)
         
         # Train model
-        history = trainer.train_model(X_train, y_train, X_val, y_val, epochs=100)
+        history = trainer.train_model(X_train, y_train, X_val, y_val, epochs=args.epochs,
+                                      batch_size=batch_size, use_tf_data=args.tf_data,
+                                      augment=args.augment, cache=args.cache,
+                                      shuffle_buffer=args.shuffle_buffer,
+                                      learning_rate=learning_rate, jit_compile=args.cpu and not args.no_jit,
+                                      warmup_epochs=warmup_epochs)
         
         # Save model artifacts
-        trainer.save_model_artifacts()
+        trainer.save_model_artifacts(publish=not args.no_publish)
         
         # Plot training history
         trainer.plot_training_history(history)
@@ -267,10 +639,11 @@ def main():
         trainer.evaluate_model()
         
         print("\nTraining completed successfully!")
-        print("Files generated:")
-        print("- model/model.h5")
-        print("- model/labels.txt") 
-        print("- model/attr_config.json")
+        print(f"Files generated in {args.output_path}/versions/{trainer.version}/:")
+        print("- model.h5")
+        print("- labels.txt") 
+        print("- attr_config.json")
+        print("- serving/ (NumPy serving weights)")
         
     except Exception as e:
         print(f"Error during training: {str(e)}")
@@ -0,0 +1,145 @@
+"""MicroBatcher contract: stacking, batch size bound, back-pressure, errors and draining.
+
+Forward passes are gated on events so the tests control exactly what is
+queued while the worker is busy, instead of relying on timing.
+"""
+import os
+import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.batching import MicroBatcher, QueueFullError
+
+
+class GatedModel:
+    """Two-head predict_fn that records every batch; with ``gate`` each pass waits for it"""
+
+    def __init__(self, gate=None, error=None):
+        self.gate = gate
+        self.error = error
+        self.batches = []
+        self.started = threading.Event()
+
+    def __call__(self, X):
+        self.batches.append(X.shape[0])
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        return [X * 2.0, X.sum(axis=1, keepdims=True)]
+
+
+def _rows(i, n=1):
+    return np.full((n, 3), float(i), dtype=np.float32)
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.001)
+
+
+def _busy(batcher, model):
+    """Occupy the worker with one request; returns its future"""
+    pool = ThreadPoolExecutor(1)
+    future = pool.submit(batcher.submit, _rows(-1), 5)
+    assert model.started.wait(5)
+    pool.shutdown(wait=False)
+    return future
+
+
+def test_concurrent_submits_share_one_forward_pass():
+    model = GatedModel()
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=1000)
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda i: batcher.submit(_rows(i), timeout=5), range(4)))
+    batcher.close()
+
+    # the batch is dispatched as soon as it is full, long before max_wait_ms
+    assert model.batches == [4]
+    for i, (doubled, total) in enumerate(results):
+        np.testing.assert_array_equal(doubled, _rows(i) * 2.0)
+        np.testing.assert_array_equal(total, [[3.0 * i]])
+
+
+def test_batches_respect_max_batch_size():
+    gate = threading.Event()
+    model = GatedModel(gate)
+    batcher = MicroBatcher(model, max_batch_size=5, max_wait_ms=50, max_queue=64)
+    first = _busy(batcher, model)
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(batcher.submit, _rows(i, 2), 5) for i in range(8)]
+        _wait_for(lambda: batcher.queue_depth() == 8)
+        gate.set()
+        results = [f.result() for f in futures]
+    first.result()
+    batcher.close()
+
+    # 2-row requests never split across batches, so at most two fit in five rows
+    assert model.batches[0] == 1 and all(rows <= 4 for rows in model.batches[1:])
+    assert sum(model.batches) == 17
+    for i, (doubled, _) in enumerate(results):
+        np.testing.assert_array_equal(doubled, _rows(i, 2) * 2.0)
+
+
+def test_full_queue_raises():
+    gate = threading.Event()
+    model = GatedModel(gate)
+    batcher = MicroBatcher(model, max_batch_size=1, max_queue=1)
+    first = _busy(batcher, model)
+    with ThreadPoolExecutor(1) as pool:
+        queued = pool.submit(batcher.submit, _rows(1), 5)
+        _wait_for(lambda: batcher.queue_depth() == 1)
+        with pytest.raises(QueueFullError):
+            batcher.submit(_rows(2), timeout=5)
+        gate.set()
+        queued.result()
+    first.result()
+    assert batcher.stats()['rejected'] == 1
+    batcher.close()
+
+
+def test_predict_error_reaches_every_caller():
+    error = ValueError("bad batch")
+    model = GatedModel(error=error)
+    batcher = MicroBatcher(model, max_batch_size=3, max_wait_ms=1000)
+    with ThreadPoolExecutor(3) as pool:
+        futures = [pool.submit(batcher.submit, _rows(i), 5) for i in range(3)]
+        raised = [f.exception(5) for f in futures]
+    assert model.batches == [3]
+    assert all(e is error for e in raised)
+    assert batcher.stats()['errors'] == 1
+
+    # the worker survives a failed batch
+    model.error = None
+    np.testing.assert_array_equal(batcher.submit(_rows(7), timeout=5)[0], _rows(7) * 2.0)
+    batcher.close()
+
+
+def test_close_with_drain_serves_pending_requests():
+    gate = threading.Event()
+    model = GatedModel(gate)
+    batcher = MicroBatcher(model, max_batch_size=2, max_wait_ms=1)
+    first = _busy(batcher, model)
+    with ThreadPoolExecutor(5) as pool:
+        futures = [pool.submit(batcher.submit, _rows(i), 5) for i in range(4)]
+        _wait_for(lambda: batcher.queue_depth() == 4)
+        closing = pool.submit(batcher.close, True)
+        _wait_for(lambda: batcher._closed)
+        with pytest.raises(RuntimeError, match='closed'):
+            batcher.submit(_rows(9), timeout=5)
+        gate.set()
+        closing.result(5)
+        results = [f.result() for f in futures]
+    first.result()
+    for i, (doubled, _) in enumerate(results):
+        np.testing.assert_array_equal(doubled, _rows(i) * 2.0)
+    assert sum(model.batches) == 5
@@ -0,0 +1,88 @@
+"""The preprocessed image cache keeps entries until their source is gone or it is over size.
+
+Also checks that preprocess_data.py caches uint8 pixels for both storage
+formats, so compact and float32 runs share one cache entry per image.
+"""
+import os
+import sys
+import glob
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytest.importorskip('sklearn')
+
+from scripts.image_cache import PreprocessedImageCache
+from scripts.preprocess_data import PalmistryDataPreprocessor
+from scripts.preprocessing import normalize
+
+
+def _sources(tmp_path, n):
+    paths = []
+    for i in range(n):
+        path = tmp_path / f'src{i}.bin'
+        path.write_bytes(bytes([i]) * 64)
+        paths.append(str(path))
+    return paths
+
+
+def _objects(cache_dir):
+    return glob.glob(os.path.join(cache_dir, 'objects', '*', '*.npy'))
+
+
+def test_prune_keeps_entries_made_with_other_params(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    paths = _sources(tmp_path, 3)
+    for size in (16, 32):
+        cache = PreprocessedImageCache(cache_dir, {'image_size': size})
+        for path in paths:
+            cache.put(path, np.zeros(size, dtype=np.uint8))
+        assert cache.prune(paths) == 0
+        cache.save()
+    assert len(_objects(cache_dir)) == 6
+
+    # switching back to the first parameters is still a hit
+    cache = PreprocessedImageCache(cache_dir, {'image_size': 16})
+    assert cache.get(paths[0]).shape == (16,)
+
+    # a deleted source loses its entries under every parameter set
+    os.remove(paths[0])
+    assert cache.prune(paths[1:]) == 2
+    assert len(_objects(cache_dir)) == 4
+
+
+def test_prune_trims_lru_over_max_bytes(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    paths = _sources(tmp_path, 4)
+    cache = PreprocessedImageCache(cache_dir, {'image_size': 8})
+    for i, path in enumerate(paths):
+        cache.put(path, np.zeros(1000, dtype=np.uint8))
+        obj = cache._object_path(cache._key(cache._content_hash(path)))
+        os.utime(obj, (1000 + i, 1000 + i))
+    entry_bytes = os.path.getsize(_objects(cache_dir)[0])
+    cache.max_bytes = 2 * entry_bytes
+    assert cache.prune(paths) == 2
+    assert cache.get(paths[0]) is None and cache.get(paths[1]) is None
+    assert cache.get(paths[3]) is not None
+
+
+def test_cache_holds_uint8_for_float32_datasets(tmp_path):
+    raw = tmp_path / 'raw' / 'life'
+    os.makedirs(raw)
+    rng = np.random.default_rng(0)
+    for i in range(2):
+        Image.fromarray(rng.integers(0, 256, (40, 30, 3), dtype=np.uint8)).save(raw / f'{i}.png')
+    cache_dir = str(tmp_path / 'cache')
+
+    rows = {}
+    for compact in (True, False):
+        prep = PalmistryDataPreprocessor(str(tmp_path / 'raw'), str(tmp_path / 'out'), num_workers=1,
+                                         cache_dir=cache_dir, compact=compact,
+                                         preprocessing={'image_size': [12, 10]})
+        rows[compact] = prep._load_image(str(raw / '0.png'))
+        assert rows[compact].dtype == prep.storage_dtype
+    # one shared uint8 entry, served normalized to the float32 run
+    assert [np.load(obj).dtype for obj in _objects(cache_dir)] == [np.uint8]
+    np.testing.assert_array_equal(rows[False], normalize(rows[True]))
@@ -0,0 +1,65 @@
+"""Every labelled metric call in the web tier passes exactly the declared labels.
+
+Metric._key raises ValueError on a missing or extra label, which turns the
+request into a 500, so this is checked statically over the source.
+"""
+import os
+import ast
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES = ['app.py', 'asgi.py']
+LABELLED_CALLS = {'inc', 'set', 'observe', 'time'}
+
+
+def _declared_labels(tree):
+    """NAME -> labelnames for ``NAME = REGISTRY.counter/gauge/histogram(name, doc, [labels])``"""
+    declared = {}
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Assign) and isinstance(node.value, ast.Call)):
+            continue
+        func = node.value.func
+        if not (isinstance(func, ast.Attribute) and func.attr in ('counter', 'gauge', 'histogram')):
+            continue
+        labels = node.value.args[2] if len(node.value.args) > 2 else None
+        for kw in node.value.keywords:
+            if kw.arg == 'labelnames':
+                labels = kw.value
+        names = ast.literal_eval(labels) if labels is not None else ()
+        for target in node.targets:
+            if isinstance(target, ast.Name):
+                declared[target.id] = set(names)
+    return declared
+
+
+def _metric_calls(tree, declared):
+    """(metric name, keyword names, line) for calls like REQUESTS.inc(...) or core.REQUESTS.inc(...)"""
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in LABELLED_CALLS):
+            continue
+        owner = node.func.value
+        name = owner.id if isinstance(owner, ast.Name) else owner.attr if isinstance(owner, ast.Attribute) else None
+        if name in declared and all(kw.arg is not None for kw in node.keywords):
+            yield name, {kw.arg for kw in node.keywords}, node.lineno
+
+
+def _parse(name):
+    with open(os.path.join(ROOT, name), 'r', encoding='utf-8') as f:
+        return ast.parse(f.read(), filename=name)
+
+
+DECLARED = _declared_labels(_parse('app.py'))
+
+
+def test_requests_counter_declares_model_version():
+    assert DECLARED['REQUESTS'] == {'endpoint', 'status', 'model_version'}
+
+
+@pytest.mark.parametrize('source', SOURCES)
+def test_metric_calls_use_full_label_set(source):
+    calls = list(_metric_calls(_parse(source), DECLARED))
+    bad = [f"{source}:{line} {name} got {sorted(labels)}, expects {sorted(DECLARED[name])}"
+           for name, labels, line in calls if labels != DECLARED[name]]
+    assert not bad, "\n".join(bad)
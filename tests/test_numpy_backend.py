@@ -0,0 +1,84 @@
+"""The NumPy serving backend reproduces Keras for every stored weight dtype.
+
+Exports a small multi-output Dense model as float32, float16 and int8,
+loads each artifact plain, memory-mapped and dequantized, and checks it
+against Keras with check_parity.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+keras = pytest.importorskip('tensorflow').keras
+
+from scripts.numpy_backend import (WEIGHT_DTYPES, export_dense_model, quantize_kernel, _matmul,
+                                   NumpyDenseModel, check_parity)
+
+INPUT_DIM = 96
+# quantization error on top of float32 rounding; measured ~1.4e-4 (float16) and ~1.9e-3 (int8)
+ATOL = {'float32': 1e-5, 'float16': 1e-3, 'int8': 1e-2}
+
+
+@pytest.fixture(scope='module')
+def keras_model():
+    """Shared trunk with three heads (softmax, softmax, sigmoid), like the five-head palm model"""
+    keras.utils.set_random_seed(0)
+    inputs = keras.Input(shape=(INPUT_DIM,))
+    x = keras.layers.Dense(48, activation='relu', name='trunk_1')(inputs)
+    x = keras.layers.Dropout(0.3)(x)
+    x = keras.layers.Dense(24, activation='tanh', name='trunk_2')(x)
+    outputs = [keras.layers.Dense(4, activation='softmax', name='line_type')(x),
+               keras.layers.Dense(3, activation='softmax', name='length_cls')(x),
+               keras.layers.Dense(1, activation='sigmoid', name='breaks_cls')(x)]
+    return keras.Model(inputs, outputs)
+
+
+@pytest.fixture(scope='module')
+def artifacts(keras_model, tmp_path_factory):
+    root = tmp_path_factory.mktemp('serving')
+    out = {}
+    for dtype in WEIGHT_DTYPES:
+        out[dtype] = str(root / dtype)
+        export_dense_model(keras_model, out[dtype], weight_dtype=dtype)
+    return out
+
+
+@pytest.mark.parametrize('dequantize', [False, True])
+@pytest.mark.parametrize('mmap', [False, True])
+@pytest.mark.parametrize('dtype', WEIGHT_DTYPES)
+def test_parity_with_keras(keras_model, artifacts, dtype, mmap, dequantize):
+    model = NumpyDenseModel.load(artifacts[dtype], dequantize=dequantize, mmap=mmap)
+    max_diff, agreement = check_parity(keras_model, model, num_rows=32, atol=ATOL[dtype])
+    assert len(model(np.zeros(INPUT_DIM, dtype=np.float32))) == 3
+    if dtype == 'float32':
+        assert agreement == 1.0
+
+    kernels = [kernel for kernel, _, _ in model.weights.values()]
+    expected = np.float32 if dtype == 'float32' or dequantize else np.dtype(dtype)
+    assert all(k.dtype == expected for k in kernels)
+    # dequantizing makes a private float32 copy, so only a plain mmap load stays mapped
+    mapped = mmap and (dtype == 'float32' or not dequantize)
+    assert all(isinstance(k, np.memmap) == mapped for k in kernels)
+
+
+def test_quantized_artifacts_are_smaller(artifacts):
+    sizes = {dtype: NumpyDenseModel.load(path).nbytes() for dtype, path in artifacts.items()}
+    assert sizes['int8'] < sizes['float16'] < sizes['float32']
+
+
+@pytest.mark.parametrize('dtype', ['float16', 'int8'])
+@pytest.mark.parametrize('block_rows', [1, 7, 64, 1000])
+def test_blockwise_matmul_matches_dequantized(dtype, block_rows):
+    """Row blocks (including a ragged last block) sum to the full dequantized product"""
+    rng = np.random.default_rng(1)
+    kernel = rng.normal(size=(100, 9)).astype(np.float32)
+    x = rng.random((5, 100), dtype=np.float32)
+    stored, scale = quantize_kernel(kernel, dtype)
+    dense = stored.astype(np.float32) * (scale if scale is not None else 1.0)
+
+    out = _matmul(x, stored, scale, block_rows=block_rows)
+    assert out.dtype == np.float32
+    np.testing.assert_allclose(out, x @ dense, rtol=1e-5, atol=1e-5)
+    np.testing.assert_allclose(out, x @ kernel, atol=ATOL[dtype] * 10)
@@ -0,0 +1,106 @@
+"""Training and serving turn the same image bytes into the same model input.
+
+Builds a small raw image directory, runs preprocess_data.py on it (compact
+uint8 and float32), reads the rows back through the trainer's batch readers
+and compares them with what the serving preprocessor makes of the same file.
+"""
+import os
+import sys
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+pytest.importorskip('tensorflow')
+
+from scripts.preprocess_data import PalmistryDataPreprocessor
+from scripts.preprocessing import ImagePreprocessor
+from scripts.train import PalmistryANNTrainer, NormalizedBatchSequence
+
+IMAGE_SIZE = [40, 24]
+
+
+@pytest.fixture(scope='module')
+def raw_dir(tmp_path_factory):
+    """Two classes of distinct noise images in JPEG and PNG, one with an EXIF rotation"""
+    root = tmp_path_factory.mktemp('raw')
+    rng = np.random.default_rng(0)
+    for cls in ('head', 'life'):
+        os.makedirs(root / cls)
+        for i in range(7):
+            img = Image.fromarray(rng.integers(0, 256, (90 + 10 * i, 120, 3), dtype=np.uint8))
+            if i == 0:
+                exif = img.getexif()
+                exif[0x0112] = 6  # rotate 90 CW on display
+                img.save(root / cls / f'{i}.jpg', exif=exif)
+            elif i % 2:
+                img.save(root / cls / f'{i}.jpg', quality=85)
+            else:
+                img.save(root / cls / f'{i}.png')
+    return str(root)
+
+
+def _served(raw_dir, attr_cfg):
+    """Serving-side rows, built the way ServingModel.load builds its preprocessor"""
+    preprocessor = ImagePreprocessor.for_model(attr_cfg)
+    rows = {}
+    for cls in sorted(os.listdir(raw_dir)):
+        for name in sorted(os.listdir(os.path.join(raw_dir, cls))):
+            with open(os.path.join(raw_dir, cls, name), 'rb') as f:
+                rows[f'{cls}/{name}'] = preprocessor.preprocess(f.read())[0]
+    return rows
+
+
+def _assert_same_rows(trained, served):
+    """Every training row equals exactly one served row, and every image is present"""
+    assert len(trained) == len(served)
+    matched = set()
+    for row in trained:
+        hits = [name for name, s in served.items() if np.array_equal(row, s)]
+        assert len(hits) == 1, f"training row matches {len(hits)} served images"
+        matched.add(hits[0])
+    assert matched == set(served)
+
+
+def _trainer_rows(trainer, split, name, reader):
+    X = trainer._load_features(split, name)
+    y = np.zeros((len(X), 2), dtype=np.float32)
+    if reader == 'sequence':
+        seq = NormalizedBatchSequence(X, y, batch_size=4, shuffle=False)
+        return np.concatenate([seq[i][0] for i in range(len(seq))])
+    return np.concatenate([xb.numpy() for xb, _ in trainer.make_dataset(X, y, batch_size=4)])
+
+
+@pytest.mark.parametrize('compact,reader', [(True, 'sequence'), (True, 'dataset'), (False, 'dataset')])
+@pytest.mark.parametrize('color_mode', ['bgr', 'gray'])
+def test_training_rows_match_serving(raw_dir, tmp_path, compact, reader, color_mode):
+    data_dir = str(tmp_path / 'data')
+    PalmistryDataPreprocessor(raw_dir, data_dir, num_workers=2, compact=compact,
+                              preprocessing={'image_size': IMAGE_SIZE, 'color_mode': color_mode}
+                              ).preprocess_data(streaming=True, chunk_size=5)
+
+    trainer = PalmistryANNTrainer(data_dir, str(tmp_path / 'model'))
+    # what save_model_artifacts writes into attr_config.json
+    attr_cfg = json.loads(json.dumps({'preprocessing': trainer.dataset_preprocessor().config}))
+    served = _served(raw_dir, attr_cfg)
+
+    trained = np.concatenate([_trainer_rows(trainer, split, name, reader) for split, name in
+                              (('train', 'X_train.npy'), ('valid', 'X_val.npy'), ('test', 'X_test.npy'))])
+    assert trained.dtype == np.float32
+    assert trained.shape[1] == ImagePreprocessor.for_model(attr_cfg).input_dim
+    _assert_same_rows(trained, served)
+
+
+def test_eager_and_streaming_write_identical_arrays(raw_dir, tmp_path):
+    out = {}
+    for streaming in (False, True):
+        data_dir = str(tmp_path / f'data_{streaming}')
+        PalmistryDataPreprocessor(raw_dir, data_dir, num_workers=1, compact=True,
+                                  preprocessing={'image_size': IMAGE_SIZE}).preprocess_data(streaming=streaming)
+        out[streaming] = [np.load(os.path.join(data_dir, split, name)) for split, name in
+                          (('train', 'X_train.npy'), ('valid', 'X_val.npy'), ('test', 'X_test.npy'),
+                           ('train', 'y_train.npy'), ('test', 'y_test.npy'))]
+    for eager, streamed in zip(out[False], out[True]):
+        np.testing.assert_array_equal(eager, streamed)
@@ -0,0 +1,60 @@
+"""RuleEngine refuses incomplete or ambiguous rule sets and compiles model/rules.json."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.rule_engine import RuleEngine, RuleError, RULES_PATH
+
+ATTRIBUTES = {
+    'line_type': ['head', 'life'],
+    'length_cls': ['short', 'long'],
+    'slope_cls': ['flat'],
+    'curv_cls': ['straight'],
+    'breaks_cls': ['none'],
+}
+BASE_RULES = [
+    {'id': 'summary', 'aspect': 'summary', 'text': 'a line'},
+    {'id': 'length.short', 'aspect': 'length', 'when': {'length_cls': 'short'}, 'text': 'short'},
+    {'id': 'length.long', 'aspect': 'length', 'when': {'length_cls': 'long'}, 'text': 'long'},
+]
+
+
+def _engine(*extra, rules=BASE_RULES):
+    return RuleEngine(ATTRIBUTES, ['summary', 'length'], list(rules) + list(extra))
+
+
+def test_inline_rules_compile_most_specific_first():
+    engine = _engine({'id': 'life.summary', 'aspect': 'summary', 'when': {'line_type': 'life'}, 'text': 'life'})
+    pred = {'length_cls': 'long', 'slope_cls': 'flat', 'curv_cls': 'straight', 'breaks_cls': 'none'}
+    assert engine.interpret('life', pred)['reading'] == {'summary': 'life', 'length': 'long'}
+    assert engine.interpret('head', pred)['rules'] == ['summary', 'length.long']
+    assert engine.unused() == []
+
+
+def test_coverage_gap():
+    with pytest.raises(RuleError, match="no 'length' rule covers"):
+        _engine(rules=BASE_RULES[:2])
+
+
+def test_same_specificity_conflict():
+    with pytest.raises(RuleError, match='same specificity'):
+        _engine({'id': 'length.short.again', 'aspect': 'length', 'when': {'length_cls': 'short'}, 'text': 'x'})
+
+
+def test_unknown_value():
+    with pytest.raises(RuleError, match="length_cls='medium' is not one of"):
+        _engine({'id': 'length.medium', 'aspect': 'length', 'when': {'length_cls': 'medium'}, 'text': 'x'})
+
+
+def test_lookup_against_shipped_rules():
+    engine = RuleEngine.load(RULES_PATH)
+    pred = {'length_cls': 'long', 'slope_cls': 'up', 'curv_cls': 'curved', 'breaks_cls': 'none'}
+    result = engine.interpret('life', pred)
+    assert result['rules'] == ['life.summary.strong', 'length.long', 'slope.up', 'curv.curved', 'breaks.none']
+    # a null text leaves the aspect out of the reading
+    assert set(result['reading']) == {'summary', 'length', 'slope', 'curvature'}
+    with pytest.raises(RuleError, match='no interpretation'):
+        engine.interpret('palm', pred)